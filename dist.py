@@ -1,7 +1,6 @@
 from __future__ import absolute_import
 from __future__ import print_function
 import os
-import re
 # pylint: disable=no-name-in-module, import-error
 import subprocess
 from distutils.dir_util import copy_tree, remove_tree
@@ -60,11 +59,6 @@ subprocess.check_call(["sphinx-apidoc",
                        "--output-dir=" + DIST_DOCTMP_DIR,
                        os.path.join(DIST_PY_FILE_LOCATION, "dxlconsole")])
 
-# Delete web files
-for f in os.listdir(DIST_DOCTMP_DIR):
-    if re.search("dxlconsole.web.*", f):
-        os.remove(os.path.join(DIST_DOCTMP_DIR, f))
-
 print("\nCopying conf.py, docutils.conf, and sdk directory\n")
 copy_file(os.path.join(DIST_PY_FILE_LOCATION, "doc", "conf.py"),
           os.path.join(DIST_DOCTMP_DIR, "conf.py"))
@@ -3,6 +3,11 @@ try:
 except ImportError:
     from ConfigParser import ConfigParser
 
+try:
+    from time import monotonic # pylint: disable=unused-import
+except ImportError:
+    from time import time as monotonic # pylint: disable=unused-import
+
 
 def read_file(config_parser, file_like_obj):
     return config_parser.read_file(file_like_obj) \
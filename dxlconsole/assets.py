@@ -0,0 +1,534 @@
+from __future__ import absolute_import
+import gzip
+import hashlib
+import io
+import mmap
+import os
+import re
+import struct
+import zipfile
+import zlib
+
+import pkg_resources
+
+
+#: The suffix of the gzip-compressed copies of the assets
+GZIP_SUFFIX = ".gz"
+
+#: The extensions of the assets that are worth compressing
+COMPRESSIBLE_EXTENSIONS = (".js", ".css", ".html", ".htm", ".json", ".svg",
+                           ".txt", ".xml")
+
+#: The minimum size (in bytes) of an asset that is worth compressing
+MIN_COMPRESSIBLE_SIZE = 1024
+
+#: The extensions of the images, which are referenced by the bundle hash (see
+#: :meth:`AssetManifest.url`)
+IMAGE_EXTENSIONS = (".png", ".gif", ".jpg", ".jpeg", ".svg", ".ico")
+
+#: The name of the archive of the assets (a package resource)
+ARCHIVE_NAME = "web.zip"
+
+#: The name of the directory of the assets (a package resource)
+DIRECTORY_NAME = "web"
+
+# The size of the chunks that asset content is read in
+_CHUNK_SIZE = 65536
+
+
+def _is_asset_file(file_name):
+    """
+    Returns whether the specified file is an asset (rather than compiled
+    Python left over from when the assets directory was a Python package)
+
+    :param file_name: The name of the file
+    :return: Whether the file is an asset
+    """
+    return not file_name.endswith((".pyc", ".pyo"))
+
+
+def _walk_assets(root):
+    """
+    Returns the assets in the specified directory
+
+    :param root: The directory containing the assets
+    :return: A generator of ``(path relative to the root, absolute path)``
+        tuples, ordered by path
+    """
+    for directory, directory_names, file_names in os.walk(root):
+        directory_names[:] = sorted(name for name in directory_names
+                                    if name != "__pycache__")
+        for file_name in sorted(file_names):
+            if _is_asset_file(file_name):
+                absolute_path = os.path.join(directory, file_name)
+                yield os.path.relpath(absolute_path, root).replace(os.sep, "/"), \
+                    absolute_path
+
+
+def _tree_modified_time(root):
+    """
+    Returns the time the specified directory tree was last modified, the
+    latest modification time of its directories (which changes when files are
+    added, removed or renamed) and assets
+
+    :param root: The directory
+    :return: The time the tree was last modified (seconds since the epoch)
+    """
+    modified = os.path.getmtime(root)
+    for directory, directory_names, file_names in os.walk(root):
+        directory_names[:] = [name for name in directory_names
+                              if name != "__pycache__"]
+        modified = max(modified, os.path.getmtime(directory))
+        for file_name in file_names:
+            if _is_asset_file(file_name):
+                modified = max(modified, os.path.getmtime(
+                    os.path.join(directory, file_name)))
+    return modified
+
+
+def is_archive_current(root, archive_path):
+    """
+    Returns whether the specified asset archive (see
+    :func:`write_asset_archive`) is current for the assets in the specified
+    directory, i.e. it exists and was written after the directory tree was
+    last modified
+
+    :param root: The directory containing the assets
+    :param archive_path: The path of the archive
+    :return: Whether the archive is current
+    """
+    return os.path.isfile(archive_path) and \
+        os.path.getmtime(archive_path) >= _tree_modified_time(root)
+
+
+def _is_sidecar(absolute_path):
+    """
+    Returns whether the specified file is the gzip sidecar of another file
+
+    :param absolute_path: The absolute path of the file
+    :return: Whether the file is a gzip sidecar
+    """
+    return absolute_path.endswith(GZIP_SUFFIX) and \
+        os.path.isfile(absolute_path[:-len(GZIP_SUFFIX)])
+
+
+def _file_digest(path):
+    """
+    Returns the hash of the content of the specified file
+
+    :param path: The path of the file
+    :return: The SHA-1 hash (hex string) of the content
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as asset_file:
+        for chunk in iter(lambda: asset_file.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _gzip_digest(gzip_path):
+    """
+    Returns the hash of the decompressed content of the specified gzip file
+
+    :param gzip_path: The path of the gzip file
+    :return: The SHA-1 hash (hex string) of the content, or ``None`` if the
+        file does not exist or is not a valid gzip file
+    """
+    if not os.path.isfile(gzip_path):
+        return None
+    digest = hashlib.sha1()
+    try:
+        with gzip.open(gzip_path, "rb") as gzip_file:
+            for chunk in iter(lambda: gzip_file.read(_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    except (IOError, EOFError, zlib.error):
+        return None
+    return digest.hexdigest()
+
+
+def _gzip_content(file_name, content):
+    """
+    Returns the gzip-compressed copy of the content of the specified asset,
+    if the asset is worth compressing
+
+    :param file_name: The file name of the asset
+    :param content: The content of the asset (bytes)
+    :return: The compressed content (bytes), or ``None`` if the asset is not
+        compressible or compression does not reduce its size by at least 10%
+    """
+    if not file_name.lower().endswith(COMPRESSIBLE_EXTENSIONS) or \
+            len(content) < MIN_COMPRESSIBLE_SIZE:
+        return None
+    compressed = io.BytesIO()
+    # A fixed modification time keeps the compressed copy reproducible
+    with gzip.GzipFile(file_name, "wb", 9, compressed, 0) as compressor:
+        compressor.write(content)
+    compressed = compressed.getvalue()
+    return compressed if len(compressed) <= len(content) * 0.9 else None
+
+
+def write_asset_archive(root, archive_path):
+    """
+    Writes the assets in the specified directory, along with a gzip-compressed
+    copy of each compressible asset, to a single archive, which the console
+    serves the assets from (see :class:`ArchiveAssetStore`). The compressed
+    copies are only written to the archive, never to the directory.
+
+    The archive is a zip file whose entries are stored uncompressed, so that
+    their content can be served directly from the (memory-mapped) archive.
+    The comment of each entry holds the SHA-1 hash of its content. Sidecars
+    found in the directory (see :class:`DirectoryAssetStore`) are left out,
+    as the compressed copies are written in their place.
+
+    This function is run by the ``pack_assets`` setup command when the
+    package is built.
+
+    :param root: The directory containing the assets
+    :param archive_path: The path of the archive to write
+    :return: The number of assets written to the archive
+    """
+    count = 0
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_STORED) as archive:
+        for path, absolute_path in _walk_assets(root):
+            if _is_sidecar(absolute_path):
+                continue
+            with open(absolute_path, "rb") as asset_file:
+                content = asset_file.read()
+            _write_archive_entry(archive, path, content,
+                                 hashlib.sha1(content).hexdigest())
+            count += 1
+            gzip_content = _gzip_content(os.path.basename(path), content)
+            if gzip_content is not None:
+                _write_archive_entry(archive, path + GZIP_SUFFIX, gzip_content,
+                                     hashlib.sha1(gzip_content).hexdigest())
+    return count
+
+
+def _write_archive_entry(archive, path, content, digest):
+    """
+    Writes an (uncompressed) entry to the asset archive
+
+    :param archive: The :class:`zipfile.ZipFile` to write to
+    :param path: The path of the entry
+    :param content: The content of the entry (bytes)
+    :param digest: The SHA-1 hash (hex string) of the content
+    """
+    # A fixed date keeps the archive reproducible
+    entry = zipfile.ZipInfo(path, (1980, 1, 1, 0, 0, 0))
+    entry.compress_type = zipfile.ZIP_STORED
+    entry.external_attr = 0o644 << 16
+    entry.comment = digest.encode("ascii")
+    archive.writestr(entry, content)
+
+
+class Asset(object):
+    """
+    A static asset (file) served by the console
+    """
+
+    __slots__ = ("path", "size", "content_hash", "modified", "location",
+                 "gzip_size", "gzip_location")
+
+    def __init__(self, path, size, content_hash, modified, location):
+        """
+        Constructor parameters:
+
+        :param path: The path of the asset, relative to the web root
+        :param size: The size of the asset (in bytes)
+        :param content_hash: The hash of the asset's content (hex string)
+        :param modified: The time the asset was modified (seconds since the
+            epoch)
+        :param location: The location of the asset's content in its store
+        """
+        self.path = path
+        self.size = size
+        self.content_hash = content_hash
+        self.modified = modified
+        self.location = location
+        #: The size of the gzip-compressed copy of the asset (see
+        #: :func:`write_asset_archive`), or ``None`` if there is no copy
+        self.gzip_size = None
+        #: The location of the gzip-compressed copy of the asset in its store
+        self.gzip_location = None
+
+
+class DirectoryAssetStore(object):
+    """
+    A store of assets held as files in a directory (used when running from a
+    source tree). The location of an asset is the absolute path of its file.
+    A gzip-compressed copy of an asset that is already in the directory (a
+    "sidecar", such as those shipped with the SmartClient framework) is
+    served if its content matches the asset, no copies are written.
+    """
+
+    def __init__(self, root):
+        """
+        Constructor parameters:
+
+        :param root: The directory containing the assets
+        """
+        self._root = root
+
+    def assets(self):
+        """
+        Returns the assets in the store
+
+        :return: A generator of :class:`Asset` objects (whose content hashes
+            are full SHA-1 hashes)
+        """
+        for path, absolute_path in _walk_assets(self._root):
+            if _is_sidecar(absolute_path):
+                continue
+            digest = _file_digest(absolute_path)
+            asset = Asset(path, os.path.getsize(absolute_path), digest,
+                          os.path.getmtime(absolute_path), absolute_path)
+            # Only serve a sidecar whose content matches the asset
+            gzip_path = absolute_path + GZIP_SUFFIX
+            if _gzip_digest(gzip_path) == digest:
+                asset.gzip_size = os.path.getsize(gzip_path)
+                asset.gzip_location = gzip_path
+            yield asset
+
+    def read(self, location, size, start=None, end=None):
+        """
+        Reads content from the store
+
+        :param location: The location of the content
+        :param size: The size of the content
+        :param start: The offset of the first byte to read
+        :param end: The offset after the last byte to read
+        :return: A generator of the content (in chunks of bytes)
+        """
+        start = start or 0
+        remaining = (size if end is None else end) - start
+        with open(location, "rb") as asset_file:
+            asset_file.seek(start)
+            while remaining > 0:
+                chunk = asset_file.read(min(_CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+
+class ArchiveAssetStore(object):
+    """
+    A store of assets held in a single, memory-mapped archive (see
+    :func:`write_asset_archive`). The location of an asset is the offset of
+    its content in the archive, so that its content is served by slicing the
+    mapping rather than by opening a file.
+    """
+
+    # The start of the local header of a zip entry: the signature, the fields
+    # that are not used, the name length and the extra field length
+    _LOCAL_HEADER = struct.Struct("<4s22xHH")
+    _LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+    def __init__(self, archive_path):
+        """
+        Constructor parameters:
+
+        :param archive_path: The path of the archive
+        """
+        self._modified = os.path.getmtime(archive_path)
+        with open(archive_path, "rb") as archive_file:
+            self._map = mmap.mmap(archive_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            # The index of the archive: path -> (offset, size, SHA-1 hash)
+            self._entries = {}
+            for entry in zipfile.ZipFile(archive_file).infolist():
+                if entry.compress_type != zipfile.ZIP_STORED:
+                    raise ValueError("Asset archive entry is compressed: " +
+                                     entry.filename)
+                self._entries[entry.filename] = (
+                    self._content_offset(entry), entry.file_size,
+                    entry.comment.decode("ascii") if entry.comment else None)
+
+    def _content_offset(self, entry):
+        """
+        Returns the offset of the content of the specified entry
+
+        :param entry: The :class:`zipfile.ZipInfo` of the entry
+        :return: The offset of the content in the archive
+        """
+        signature, name_length, extra_length = self._LOCAL_HEADER.unpack_from(
+            self._map, entry.header_offset)
+        if signature != self._LOCAL_HEADER_SIGNATURE:
+            raise ValueError("Invalid asset archive entry: " + entry.filename)
+        return entry.header_offset + self._LOCAL_HEADER.size + \
+            name_length + extra_length
+
+    def assets(self):
+        """
+        Returns the assets in the store
+
+        :return: A generator of :class:`Asset` objects (whose content hashes
+            are full SHA-1 hashes)
+        """
+        for path, (offset, size, digest) in self._entries.items():
+            if path.endswith(GZIP_SUFFIX) and \
+                    path[:-len(GZIP_SUFFIX)] in self._entries:
+                continue
+            if digest is None:
+                digest = hashlib.sha1(self._map[offset:offset + size]).hexdigest()
+            asset = Asset(path, size, digest, self._modified, offset)
+            # The archive only holds the sidecars that match their assets
+            gzip_entry = self._entries.get(path + GZIP_SUFFIX)
+            if gzip_entry:
+                asset.gzip_location, asset.gzip_size, _ = gzip_entry
+            yield asset
+
+    def read(self, location, size, start=None, end=None):
+        """
+        Reads content from the store
+
+        :param location: The location of the content
+        :param size: The size of the content
+        :param start: The offset of the first byte to read
+        :param end: The offset after the last byte to read
+        :return: A generator of the content (in chunks of bytes)
+        """
+        start = location + (start or 0)
+        end = location + (size if end is None else end)
+        while start < end:
+            chunk_end = min(start + _CHUNK_SIZE, end)
+            yield self._map[start:chunk_end]
+            start = chunk_end
+
+
+class AssetManifest(object):
+    """
+    The manifest of the static assets served by the console, built once at
+    startup from the asset archive (see :func:`write_asset_archive`) or, when
+    running from a source tree, from the ``web`` directory. An archive that
+    is older than the ``web`` directory (left over from an earlier build) is
+    not used, so that edits to the assets are served.
+
+    Each asset can be referenced by a URL that contains the hash of its
+    content, see :meth:`url`. As such a URL changes whenever the content does,
+    its responses are cached by browsers indefinitely. Assets loaded by path
+    relative to a directory (the SmartClient framework loads its skins and
+    modules relative to ``isomorphicDir``) are referenced by a directory URL
+    that contains the hash of the whole manifest instead. So are images, as
+    SmartClient derives the URLs of the state variants of an icon (such as
+    ``icon_Over.png`` and ``icon_Selected_Down.png``) from the URL of the
+    icon.
+    """
+
+    #: The prefix of the (unhashed) URLs of the assets
+    PUBLIC_PREFIX = "/public/"
+
+    #: The prefix of the hashed URLs of the assets
+    HASHED_PREFIX = "/assets/"
+
+    #: The number of hex digits of the content hashes used in URLs
+    HASH_LENGTH = 16
+
+    # Matches the unhashed URLs (of assets or directories) in content
+    _PUBLIC_URL_PATTERN = re.compile(re.escape(PUBLIC_PREFIX) + r"([\w./-]+)")
+
+    def __init__(self, store=None):
+        """
+        Constructor parameters:
+
+        :param store: The store of the assets (:class:`ArchiveAssetStore` or
+            :class:`DirectoryAssetStore`), defaults to the asset archive if
+            the package contains one that is current and to the ``web``
+            directory otherwise
+        """
+        if store is None:
+            archive_path = pkg_resources.resource_filename(__name__, ARCHIVE_NAME)
+            root = pkg_resources.resource_filename(__name__, DIRECTORY_NAME)
+            if os.path.isfile(archive_path) and (
+                    not os.path.isdir(root) or
+                    is_archive_current(root, archive_path)):
+                store = ArchiveAssetStore(archive_path)
+            else:
+                store = DirectoryAssetStore(root)
+        self._store = store
+        self._assets = {}
+        for asset in store.assets():
+            asset.content_hash = asset.content_hash[:self.HASH_LENGTH]
+            self._assets[asset.path] = asset
+        bundle_hash = hashlib.sha1()
+        for path in sorted(self._assets):
+            bundle_hash.update(
+                (path + ":" + self._assets[path].content_hash).encode("utf8"))
+        self._bundle_hash = bundle_hash.hexdigest()[:self.HASH_LENGTH]
+
+    @property
+    def bundle_hash(self):
+        """
+        Returns the hash of the content of every asset in the manifest
+
+        :return: The bundle hash (hex string)
+        """
+        return self._bundle_hash
+
+    def get(self, path):
+        """
+        Returns the asset for the specified path
+
+        :param path: The path of the asset, relative to the web root
+        :return: The :class:`Asset` or ``None`` if there is no such asset
+        """
+        return self._assets.get(path)
+
+    def read(self, asset, compressed=False, start=None, end=None):
+        """
+        Reads the content of the specified asset
+
+        :param asset: The :class:`Asset`
+        :param compressed: Whether to read the gzip-compressed copy of the
+            asset
+        :param start: The offset of the first byte to read
+        :param end: The offset after the last byte to read
+        :return: A generator of the content (in chunks of bytes)
+        """
+        if compressed:
+            return self._store.read(asset.gzip_location, asset.gzip_size,
+                                    start, end)
+        return self._store.read(asset.location, asset.size, start, end)
+
+    def is_current(self, url_hash, path):
+        """
+        Returns whether the specified hash (from a hashed URL) is current for
+        the specified asset
+
+        :param url_hash: The hash from the URL
+        :param path: The path of the asset, relative to the web root
+        :return: Whether the hash is the content hash of the asset or the
+            bundle hash
+        """
+        asset = self._assets.get(path)
+        return asset is not None and \
+            url_hash in (asset.content_hash, self._bundle_hash)
+
+    def url(self, path):
+        """
+        Returns the hashed URL for the specified asset or directory
+
+        :param path: The path of the asset, or of a directory (ending with
+            ``/``), relative to the web root
+        :return: The hashed URL, or the unhashed URL if there is no such asset
+        """
+        asset = self._assets.get(path)
+        if asset is not None and not path.lower().endswith(IMAGE_EXTENSIONS):
+            return self.HASHED_PREFIX + asset.content_hash + "/" + path
+        if asset is not None or path.endswith("/"):
+            return self.HASHED_PREFIX + self._bundle_hash + "/" + path
+        return self.PUBLIC_PREFIX + path
+
+    def rewrite_urls(self, content):
+        """
+        Replaces the unhashed asset URLs in the specified content with their
+        hashed URLs
+
+        :param content: The content (text)
+        :return: The content with the hashed URLs
+        """
+        return self._PUBLIC_URL_PATTERN.sub(
+            lambda match: self.url(match.group(1)), content)
+
+    def __len__(self):
+        return len(self._assets)
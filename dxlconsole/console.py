@@ -1,9 +1,15 @@
 from __future__ import absolute_import
 import base64
+import datetime
+import hashlib
+import mimetypes
 import uuid
+import zlib
 
+from concurrent.futures import ThreadPoolExecutor
 import pkg_resources
 import tornado
+from tornado import gen
 from tornado.web import RequestHandler, Application, StaticFileHandler
 from tornado.httpserver import HTTPServer
 from tornado.ioloop import IOLoop
@@ -11,6 +17,7 @@ from tornado.ioloop import IOLoop
 from dxlclient.client_config import DxlClientConfig
 
 import dxlconsole
+from .assets import AssetManifest, GZIP_SUFFIX
 from .modules.certificates.module import CertificateModule
 from .modules.broker.module import BrokerModule
 from .modules.monitor.module import MonitorModule
@@ -21,6 +28,18 @@ class ConsoleStaticFileRequestHandler(StaticFileHandler):
     Class that is used to serve up static content in the console
     """
 
+    #: The manifest of the assets served, set by the :class:`WebConsole` at
+    #: startup (class state, as the content is read by a class method)
+    asset_manifest = None
+
+    def __init__(self, application, request, **kwargs):
+        super(ConsoleStaticFileRequestHandler, self).__init__(
+            application, request, **kwargs)
+        # The asset being served (from the asset manifest) and whether its
+        # compressed copy is served, resolved by get_absolute_path
+        self._asset = None
+        self._gzip = False
+
     def data_received(self, chunk):
         """
         Invoked when streamed request data is received
@@ -29,14 +48,24 @@ class ConsoleStaticFileRequestHandler(StaticFileHandler):
         """
         pass
 
-    @classmethod
-    def get_absolute_path(cls, root, path):
+    def parse_url_path(self, url_path):
+        """
+        Returns the path of the asset for the URL path (the paths of the asset
+        manifest use ``/`` as the separator on every platform)
+
+        :param url_path: The path from the URL
+        :return: The path of the asset, relative to the web root
+        """
+        return url_path
+
+    def get_absolute_path(self, root, path):  # pylint: disable=arguments-differ
         """
         Returns the absolute location of ``path`` relative to ``root``.
 
         :param root: The root path
         :param path: The path specified
-        :return: The absolute location of ``path`` relative to ``root``.
+        :return: The absolute location of ``path`` relative to ``root``, or
+            ``None`` if there is no such asset
         """
 
         # This is a bit hackish, but we are controlling how our static pages are
@@ -44,12 +73,22 @@ class ConsoleStaticFileRequestHandler(StaticFileHandler):
         # package resources. If a ``path`` is specified, it is used to load from
         # the package resources. This allows us to specify specific paths via
         # root (favicon, etc.), and also use the incoming path to resolve
-        # resources.
-        if root:
-            resource_path = '/'.join(("web", root))
-        else:
-            resource_path = '/'.join(("web", path))
-        return pkg_resources.resource_filename(__name__, resource_path)
+        # resources. The resources are looked up in the asset manifest, which
+        # is built at startup, and the path of the asset (rather than of a
+        # file) is returned, as its content is read from the manifest. The
+        # path of the compressed copy of an asset (which is never the path of
+        # another asset) is returned when the copy is served.
+        self._asset = self.asset_manifest.get(root or path)
+        if self._asset is None:
+            return None
+        if self._asset.gzip_location is not None:
+            # Serve the precompressed copy of the asset if the client accepts it
+            self.set_header("Vary", "Accept-Encoding")
+            if "gzip" in self.request.headers.get("Accept-Encoding", ""):
+                self._gzip = True
+                self.set_header("Content-Encoding", "gzip")
+                return self._asset.path + GZIP_SUFFIX
+        return self._asset.path
 
     def validate_absolute_path(self, root, absolute_path):
         """
@@ -58,9 +97,113 @@ class ConsoleStaticFileRequestHandler(StaticFileHandler):
         :param root: The root path
         :param absolute_path: The absolute path
         """
+        if absolute_path is None:
+            raise tornado.web.HTTPError(404)
         # Use the absolute path we already determined
         return absolute_path
 
+    @classmethod
+    def get_content(cls, abspath, start=None, end=None):
+        """
+        Returns the content of the asset (or of its compressed copy), read
+        from the asset manifest rather than from a file
+
+        :param abspath: The path of the asset, or of its compressed copy
+        :param start: The offset of the first byte to return
+        :param end: The offset after the last byte to return
+        :return: A generator of the content (in chunks of bytes)
+        """
+        asset = cls.asset_manifest.get(abspath)
+        if asset is not None:
+            return cls.asset_manifest.read(asset, False, start, end)
+        return cls.asset_manifest.read(
+            cls.asset_manifest.get(abspath[:-len(GZIP_SUFFIX)]), True,
+            start, end)
+
+    def get_content_size(self):
+        """
+        Returns the size of the asset (or of its compressed copy)
+
+        :return: The size (in bytes)
+        """
+        return self._asset.gzip_size if self._gzip else self._asset.size
+
+    def get_modified_time(self):
+        """
+        Returns the time the asset was modified
+
+        :return: The time the asset was modified (UTC)
+        """
+        modified = datetime.datetime(1970, 1, 1) + \
+            datetime.timedelta(seconds=int(self._asset.modified))
+        if tornado.version_info >= (6, 4):
+            # Tornado 6.4 compares the time with an aware datetime
+            modified = modified.replace(tzinfo=datetime.timezone.utc)
+        return modified
+
+    def compute_etag(self):
+        """
+        Returns the entity tag of the asset, its content hash from the asset
+        manifest (rather than hashing the file). The compressed copy of the
+        asset has its own entity tag.
+
+        :return: The entity tag of the asset
+        """
+        if self._gzip:
+            return '"{0}-gzip"'.format(self._asset.content_hash)
+        return '"{0}"'.format(self._asset.content_hash)
+
+    def get_content_type(self):
+        """
+        Returns the content type of the asset (rather than of its compressed
+        copy)
+
+        :return: The content type of the asset
+        """
+        mime_type, _ = mimetypes.guess_type(self._asset.path)
+        return mime_type or "application/octet-stream"
+
+
+class ConsoleAssetRequestHandler(ConsoleStaticFileRequestHandler):
+    """
+    Class that is used to serve up static content in the console under hashed
+    URLs (see :meth:`AssetManifest.url`). As the content of such a URL never
+    changes, browsers are told to cache it indefinitely without revalidating.
+    """
+
+    def parse_url_path(self, url_path):
+        """
+        Returns the path of the asset for the URL path, which starts with the
+        hash of the asset (``<hash>/<path>``)
+
+        :param url_path: The path from the URL
+        :return: The path of the asset, relative to the web root
+        """
+        url_hash, _, path = url_path.partition("/")
+        if not self.asset_manifest.is_current(url_hash, path):
+            raise tornado.web.HTTPError(404)
+        return path
+
+    def get_cache_time(self, path, modified, mime_type):
+        """
+        Returns the time (in seconds) that the asset may be cached for
+
+        :param path: The path of the asset
+        :param modified: The modification time of the asset
+        :param mime_type: The MIME type of the asset
+        :return: The time (in seconds) that the asset may be cached for
+        """
+        return self.CACHE_MAX_AGE
+
+    def set_extra_headers(self, path):
+        """
+        Sets the headers that mark the asset as immutable
+
+        :param path: The path of the asset
+        """
+        self.set_header("Cache-Control",
+                        "public, max-age={0}, immutable".format(self.CACHE_MAX_AGE))
+
 
 class ConsoleRequestHandler(BaseRequestHandler):
     """
@@ -80,19 +223,75 @@ class ConsoleRequestHandler(BaseRequestHandler):
         """
         HTTP GET
         """
+        for module in self.application.modules:
+            if module.enabled:
+                module.on_load(self.request)
+
+        page = self.application.console_page
+        self.set_header("Cache-Control", "private, no-cache")
+        self.set_header("Vary", "Accept-Encoding")
+        gzip_accepted = "gzip" in self.request.headers.get("Accept-Encoding", "")
+        # Each representation has its own (strong) entity tag
+        self.set_header("Etag", page.gzip_etag if gzip_accepted else page.etag)
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        self.set_header("Content-Type", "text/html; charset=UTF-8")
+        if gzip_accepted:
+            self.set_header("Content-Encoding", "gzip")
+            self.write(page.gzip_body)
+        else:
+            self.write(page.body)
+
+
+class ConsolePage(object):
+    """
+    The console page (HTML and the JS content of the enabled modules), which
+    is identical for every user. The page is assembled once, along with its
+    gzip-compressed variant and their entity tags.
+    """
+
+    def __init__(self, app):
+        """
+        Constructor parameters:
+
+        :param app: The web console application
+        """
+        body = self._assemble(app).encode("utf8")
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        digest = hashlib.sha1(body).hexdigest()
+
+        #: The page (UTF-8 encoded)
+        self.body = body
+        #: The gzip-compressed page
+        self.gzip_body = compressor.compress(body) + compressor.flush()
+        #: The entity tag of the page
+        self.etag = '"{0}"'.format(digest)
+        #: The entity tag of the gzip-compressed page
+        self.gzip_etag = '"{0}-gzip"'.format(digest)
+
+    @staticmethod
+    def _assemble(app):
+        """
+        Assembles the console page
+
+        :param app: The web console application
+        :return: The console page (text)
+        """
         console_html = pkg_resources.resource_string(
             __name__, "console.html").decode("utf8")
         console_html = console_html.replace("@VERSION@",
                                             dxlconsole.get_version())
         console_html = console_html.replace("@CONSOLE_NAME@",
-                                            self.application.bootstrap_app.console_name)
-        module_names = ""
+                                            app.bootstrap_app.console_name)
+        parts = [console_html]
+        module_names = []
         first_button = None
         first_pane = None
 
-        for module in self.application.modules:
+        for module in app.modules:
             if module.enabled:
-                module.on_load(self.request)
                 name = module.name
                 button_name = name + "_button"
                 if not first_button:
@@ -113,23 +312,23 @@ class ConsoleRequestHandler(BaseRequestHandler):
                         click: 'console_deck.setCurrentPane(\"" + \
                         module.root_content_name + "\")', \
                     });"
-                console_html += "\n" + toolstrip_button
-                console_html += "\n" + "console_toolstrip.addMember('" + button_name + "');"
-                console_html += module.content
-                if module_names:
-                    module_names += ","
-                module_names += "'" + module.root_content_name + "'"
-        console_html += "console_toolstrip.addMember(isc.ToolStripSpacer.create());"
-        console_html += "console_toolstrip.addMember('console_version_label');"
-        console_html += \
-            "isc.Deck.create({autoDraw:false, ID: 'console_deck', panes: [" + module_names + "] });"
+                parts.append("\n" + toolstrip_button)
+                parts.append("\n" + "console_toolstrip.addMember('" + button_name + "');")
+                parts.append(module.content)
+                module_names.append("'" + module.root_content_name + "'")
+        parts.append("console_toolstrip.addMember(isc.ToolStripSpacer.create());")
+        parts.append("console_toolstrip.addMember('console_version_label');")
+        parts.append(
+            "isc.Deck.create({autoDraw:false, ID: 'console_deck', panes: [" +
+            ",".join(module_names) + "] });")
         if first_button:
-            console_html += first_button + ".select();"
-            console_html += "console_deck.setCurrentPane('" + first_pane + "');"
-        console_html += \
-            "isc.HLayout.create({ width: '100%', height: '100%', " + \
-            "members: ['console_toolstrip', 'console_deck'] });"
-        self.write(console_html + "\n</SCRIPT></BODY></HTML>")
+            parts.append(first_button + ".select();")
+            parts.append("console_deck.setCurrentPane('" + first_pane + "');")
+        parts.append(
+            "isc.HLayout.create({ width: '100%', height: '100%', " +
+            "members: ['console_toolstrip', 'console_deck'] });")
+        parts.append("\n</SCRIPT></BODY></HTML>")
+        return app.asset_manifest.rewrite_urls("".join(parts))
 
 
 class LoginHandler(RequestHandler):
@@ -212,6 +411,10 @@ class WebConsole(Application):
     The web console application
     """
 
+    #: The maximum number of threads running blocking (DXL) calls on behalf of
+    #: request handlers
+    EXECUTOR_THREAD_COUNT = 10
+
     def __init__(self, app):
         """
         Constructor parameters:
@@ -227,6 +430,7 @@ class WebConsole(Application):
 
         handlers = [
             (r'/public/(.*)', ConsoleStaticFileRequestHandler, {'path': ''}),
+            (r'/assets/([0-9a-f]+/.*)', ConsoleAssetRequestHandler, {'path': ''}),
             (r'/favicon.ico(.*)', ConsoleStaticFileRequestHandler,
              {'path': 'images/favicon.ico'}),
             (r'/login', LoginHandler),
@@ -244,6 +448,10 @@ class WebConsole(Application):
                 handlers.extend(module.handlers)
 
         self._io_loop = IOLoop.instance()
+        self._executor = ThreadPoolExecutor(self.EXECUTOR_THREAD_COUNT)
+        self._asset_manifest = AssetManifest()
+        ConsoleStaticFileRequestHandler.asset_manifest = self._asset_manifest
+        self._console_page = None
         super(WebConsole, self).__init__(handlers, **settings)
 
     @property
@@ -273,6 +481,54 @@ class WebConsole(Application):
         """
         return self._io_loop
 
+    @property
+    def asset_manifest(self):
+        """
+        Returns the manifest of the static assets served by the console
+
+        :return: The :class:`AssetManifest`
+        """
+        return self._asset_manifest
+
+    @property
+    def console_page(self):
+        """
+        Returns the console page, which is assembled on first use
+
+        :return: The :class:`ConsolePage`
+        """
+        if self._console_page is None:
+            self._console_page = ConsolePage(self)
+        return self._console_page
+
+    @property
+    def executor(self):
+        """
+        Returns the (bounded) executor that request handlers use to run
+        blocking calls off of the IOLoop
+
+        :return: The :class:`concurrent.futures.ThreadPoolExecutor` instance
+        """
+        return self._executor
+
+    def run_blocking(self, timeout, func, *args, **kwargs):
+        """
+        Runs the specified blocking function on the executor so that it does
+        not block the IOLoop
+
+        :param timeout: The time (in seconds) to wait for the function to
+            complete
+        :param func: The function to invoke
+        :param args: The positional arguments for the function
+        :param kwargs: The keyword arguments for the function
+        :return: A future for the result of the function, which fails with
+            :class:`tornado.gen.TimeoutError` if the function does not complete
+            within the timeout
+        """
+        return gen.with_timeout(
+            datetime.timedelta(seconds=timeout),
+            self._executor.submit(func, *args, **kwargs))
+
     def start(self):
         """
         Starts the web console
@@ -15,6 +15,20 @@ class BaseRequestHandler(RequestHandler):
         """
         return self.get_secure_cookie("user")
 
+    def run_blocking(self, timeout, func, *args, **kwargs):
+        """
+        Runs the specified blocking function on the console's executor so that
+        it does not block the IOLoop, see :meth:`WebConsole.run_blocking`
+
+        :param timeout: The time (in seconds) to wait for the function to
+            complete
+        :param func: The function to invoke
+        :param args: The positional arguments for the function
+        :param kwargs: The keyword arguments for the function
+        :return: A future for the result of the function
+        """
+        return self.application.run_blocking(timeout, func, *args, **kwargs)
+
     def data_received(self, chunk):
         """Implement this method to handle streamed request data.
 
@@ -0,0 +1,52 @@
+from __future__ import absolute_import
+
+from tornado import gen
+
+from dxlconsole._compat import monotonic
+
+
+class CachedResult(object):
+    """
+    The result of a coroutine, cached for a fixed time. Requests made while
+    the result is being retrieved share the retrieval rather than starting
+    their own. A failed retrieval is not cached.
+
+    This class is not thread-safe, it must only be used from the IOLoop thread.
+    """
+
+    def __init__(self, fetch, ttl):
+        """
+        Constructor parameters:
+
+        :param fetch: The coroutine function that retrieves the result
+        :param ttl: The time (in seconds) that the result is cached for
+        """
+        self._fetch = fetch
+        self._ttl = ttl
+        self._result = None
+        # The (monotonic) time the cached result expires
+        self._expiry = 0
+        # The future for the retrieval in progress (if any)
+        self._future = None
+
+    @gen.coroutine
+    def get(self):
+        """
+        Returns the cached result, retrieving it if it has expired (a coroutine)
+
+        :return: The result
+        """
+        if self._result is not None and monotonic() < self._expiry:
+            raise gen.Return(self._result)
+        if self._future is None:
+            self._future = self._fetch()
+        future = self._future
+        try:
+            result = yield future
+            if self._future is future:
+                self._result = result
+                self._expiry = monotonic() + self._ttl
+        finally:
+            if self._future is future:
+                self._future = None
+        raise gen.Return(result)
@@ -0,0 +1,76 @@
+from __future__ import absolute_import
+from array import array
+import threading
+
+
+class HealthHistory(object):
+    """
+    A thread-safe, fixed-capacity history of broker health samples. When the
+    history is full, the oldest sample is overwritten by the newest one.
+
+    The samples are stored in a ring buffer of parallel arrays (one per field)
+    rather than as individual objects, so a full day of samples occupies a few
+    tens of kilobytes.
+    """
+
+    def __init__(self, capacity):
+        """
+        Constructor parameters:
+
+        :param capacity: The maximum number of samples retained
+        """
+        if capacity < 1:
+            raise ValueError("Health history capacity must be at least 1")
+        self._capacity = capacity
+        self._times = array("d", [0.0] * capacity)
+        self._incoming_messages = array("d", [0.0] * capacity)
+        self._outgoing_messages = array("d", [0.0] * capacity)
+        self._connected_clients = array("l", [0] * capacity)
+        # The index of the oldest sample and the number of samples
+        self._start = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, sample_time, incoming_messages, outgoing_messages,
+            connected_clients):
+        """
+        Adds a sample to the history, overwriting the oldest sample if the
+        history is full
+
+        :param sample_time: The time of the sample (seconds since the epoch)
+        :param incoming_messages: The incoming messages per second
+        :param outgoing_messages: The outgoing messages per second
+        :param connected_clients: The number of connected clients
+        """
+        with self._lock:
+            if self._count < self._capacity:
+                index = (self._start + self._count) % self._capacity
+                self._count += 1
+            else:
+                index = self._start
+                self._start = (self._start + 1) % self._capacity
+            self._times[index] = sample_time
+            self._incoming_messages[index] = incoming_messages
+            self._outgoing_messages[index] = outgoing_messages
+            self._connected_clients[index] = connected_clients
+
+    def samples(self):
+        """
+        Returns the samples in the history, oldest first
+
+        :return: A list of ``(time, incoming messages per second, outgoing
+            messages per second, connected clients)`` tuples
+        """
+        with self._lock:
+            result = []
+            for offset in range(self._count):
+                index = (self._start + offset) % self._capacity
+                result.append((self._times[index],
+                               self._incoming_messages[index],
+                               self._outgoing_messages[index],
+                               self._connected_clients[index]))
+            return result
+
+    def __len__(self):
+        with self._lock:
+            return self._count
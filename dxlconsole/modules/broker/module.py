@@ -1,16 +1,25 @@
 from __future__ import absolute_import
+import datetime
 import json
 import logging
+import threading
+import time
 import traceback
 
+from concurrent.futures import ThreadPoolExecutor
 import pkg_resources
 import tornado
 import tornado.httputil
+from tornado import gen
 
+from dxlclient.exceptions import WaitTimeoutException
 from dxlclient.message import Request, Message
 from dxlbootstrap.util import MessageUtils
+from dxlconsole._compat import monotonic
 from dxlconsole.handlers import BaseRequestHandler
 from dxlconsole.module import Module
+from dxlconsole.modules.broker.cached_result import CachedResult
+from dxlconsole.modules.broker.health_history import HealthHistory
 
 # Configure local logger
 from dxlconsole.modules.monitor.module import MonitorModule
@@ -27,6 +36,22 @@ class BrokerModule(Module):
     BROKER_REGISTRY_QUERY_TOPIC = '/mcafee/service/dxl/brokerregistry/query'
     # Request topic for Broker health info
     BROKER_HEALTH_TOPIC = '/mcafee/service/dxl/broker/health'
+    # Time (in seconds) to wait for a response to a broker registry query
+    BROKER_REGISTRY_QUERY_TIMEOUT = 5
+    # Time (in seconds) to wait for a response to a broker health request
+    BROKER_HEALTH_TIMEOUT = 15
+    # Additional time (in seconds) allowed for a broker request to be run on
+    # the executor, beyond the request timeout
+    EXECUTOR_TIMEOUT_GRACE = 5
+    # Time (in seconds) that the broker (and fabric) information is cached for
+    BROKER_INFO_TTL = 10
+    # Maximum number of brokers of the fabric that are sent health requests
+    # concurrently
+    FABRIC_THREAD_COUNT = 16
+    # Interval (in seconds) between broker health samples
+    HEALTH_SAMPLE_INTERVAL = 60
+    # Number of broker health samples retained (24 hours)
+    HEALTH_HISTORY_SIZE = 1440
 
     def __init__(self, app):
         """
@@ -38,6 +63,23 @@ class BrokerModule(Module):
             app, "broker", "Broker Details", "/public/images/broker.png",
             "broker_layout")
 
+        # The broker and fabric information, only accessed from the IOLoop
+        # thread
+        self._broker_info = CachedResult(self._fetch_broker_info,
+                                         self.BROKER_INFO_TTL)
+        self._fabric_info = CachedResult(self._fetch_fabric_info,
+                                         self.BROKER_INFO_TTL)
+        # Sends the health requests to the brokers of the fabric, so that they
+        # do not queue behind (or starve) the console's blocking calls
+        self._fabric_executor = ThreadPoolExecutor(self.FABRIC_THREAD_COUNT)
+
+        self._health_history = HealthHistory(self.HEALTH_HISTORY_SIZE)
+        if self.enabled:
+            self._health_sampler_thread = threading.Thread(
+                target=self._sample_broker_health)
+            self._health_sampler_thread.daemon = True
+            self._health_sampler_thread.start()
+
     @property
     def content(self):
         """
@@ -65,9 +107,209 @@ class BrokerModule(Module):
         :return: The web (Tornado) handlers for the module
         """
         return [
-            (r'/broker_info', BrokerInfoHandler, dict(module=self))
+            (r'/broker_info', BrokerInfoHandler, dict(module=self)),
+            (r'/broker_history', BrokerHistoryHandler, dict(module=self)),
+            (r'/fabric_info', FabricInfoHandler, dict(module=self))
         ]
 
+    @property
+    def health_history(self):
+        """
+        Returns the history of broker health samples
+
+        :return: The :class:`HealthHistory` of the broker
+        """
+        return self._health_history
+
+    def get_broker_info(self):
+        """
+        Returns the information for the connected broker (a coroutine, which
+        must be invoked on the IOLoop thread).
+
+        The information is cached for ``BROKER_INFO_TTL`` seconds. Requests made
+        while the information is being retrieved share the retrieval rather than
+        sending their own broker requests.
+
+        :return: The broker information (dict)
+        """
+        return self._broker_info.get()
+
+    def get_fabric_info(self):
+        """
+        Returns the information for every broker of the fabric (a coroutine,
+        which must be invoked on the IOLoop thread). The information is cached
+        as for :meth:`get_broker_info`.
+
+        :return: A list of the broker information (dicts), see
+            :meth:`_fetch_fabric_broker_info`
+        """
+        return self._fabric_info.get()
+
+    @gen.coroutine
+    def _fetch_broker_info(self):
+        """
+        Retrieves the information for the connected broker, sending the broker
+        registry query and the broker health request concurrently
+
+        :return: The broker information (dict)
+        """
+        registry_dict, health_dict = yield [
+            self.app.run_blocking(
+                self.BROKER_REGISTRY_QUERY_TIMEOUT + self.EXECUTOR_TIMEOUT_GRACE,
+                self._query_broker, self.BROKER_REGISTRY_QUERY_TOPIC,
+                self.BROKER_REGISTRY_QUERY_TIMEOUT),
+            self.app.run_blocking(
+                self.BROKER_HEALTH_TIMEOUT + self.EXECUTOR_TIMEOUT_GRACE,
+                self._query_broker, self.BROKER_HEALTH_TOPIC,
+                self.BROKER_HEALTH_TIMEOUT)
+        ]
+        brokerinfo = list(registry_dict['brokers'].values())[0]
+
+        broker_info = {
+            "version": brokerinfo['version'],
+            "guid": brokerinfo['guid'],
+            "connectedClients": health_dict['connectedClients'],
+            "localServiceCounter": health_dict['localServiceCounter'],
+            "incomingMessages": health_dict['incomingMessages'],
+            "outgoingMessages": health_dict['outgoingMessages'],
+            "startTime": health_dict['startTime']
+        }
+        raise gen.Return(broker_info)
+
+    @gen.coroutine
+    def _fetch_fabric_info(self):
+        """
+        Retrieves the information for every broker in the broker registry,
+        sending the health requests to the brokers concurrently
+
+        :return: A list of the broker information (dicts), ordered by host name
+        """
+        registry_dict = yield self.app.run_blocking(
+            self.BROKER_REGISTRY_QUERY_TIMEOUT + self.EXECUTOR_TIMEOUT_GRACE,
+            self._query_broker, self.BROKER_REGISTRY_QUERY_TOPIC,
+            self.BROKER_REGISTRY_QUERY_TIMEOUT)
+        fabric_info = yield [self._fetch_fabric_broker_info(brokerinfo)
+                             for brokerinfo in registry_dict['brokers'].values()]
+        fabric_info.sort(key=lambda broker_info: (broker_info["hostname"] or "",
+                                                  broker_info["guid"]))
+        raise gen.Return(fabric_info)
+
+    @gen.coroutine
+    def _fetch_fabric_broker_info(self, brokerinfo):
+        """
+        Retrieves the health of the specified broker. A broker that fails to
+        respond (in time) is reported with an error rather than failing the
+        retrieval of the fabric information.
+
+        :param brokerinfo: The broker registry entry (dict) of the broker
+        :return: The broker information (dict). The ``error`` is ``None`` unless
+            the health of the broker could not be retrieved, in which case the
+            health fields are ``None``.
+        """
+        broker_info = {
+            "guid": brokerinfo['guid'],
+            "hostname": brokerinfo.get('hostname'),
+            "port": brokerinfo.get('port'),
+            "version": brokerinfo.get('version'),
+            "connectedClients": None,
+            "localServiceCounter": None,
+            "incomingMessages": None,
+            "outgoingMessages": None,
+            "startTime": None,
+            "error": None
+        }
+        try:
+            health_dict = yield gen.with_timeout(
+                datetime.timedelta(
+                    seconds=self.BROKER_HEALTH_TIMEOUT + self.EXECUTOR_TIMEOUT_GRACE),
+                self._fabric_executor.submit(
+                    self._query_broker, self.BROKER_HEALTH_TOPIC,
+                    self.BROKER_HEALTH_TIMEOUT, brokerinfo['guid']))
+            for field in ("connectedClients", "localServiceCounter",
+                          "incomingMessages", "outgoingMessages", "startTime"):
+                broker_info[field] = health_dict[field]
+        except (gen.TimeoutError, WaitTimeoutException):
+            broker_info["error"] = "Timed out waiting for the broker to respond."
+        except Exception as ex:
+            logger.error("Error retrieving health of broker %s: %s",
+                         brokerinfo['guid'], ex)
+            broker_info["error"] = str(ex)
+        raise gen.Return(broker_info)
+
+    def get_broker_history(self, since=None):
+        """
+        Returns the broker health samples taken since the specified time, with
+        the change in the number of connected clients between samples
+
+        :param since: The time (seconds since the epoch) of the earliest sample
+            to return, ``None`` to return every sample
+        :return: A list of the samples (dicts), newest first
+        """
+        history = []
+        previous_clients = None
+        for sample_time, incoming, outgoing, clients in \
+                self._health_history.samples():
+            if since is not None and sample_time < since:
+                previous_clients = clients
+                continue
+            history.append({
+                "time": sample_time,
+                "incomingMessages": incoming,
+                "outgoingMessages": outgoing,
+                "connectedClients": clients,
+                "connectedClientsChange":
+                    0 if previous_clients is None else clients - previous_clients
+            })
+            previous_clients = clients
+        history.reverse()
+        return history
+
+    def _sample_broker_health(self):
+        """
+        A thread target that will run forever, sampling the health of the
+        broker every ``HEALTH_SAMPLE_INTERVAL`` seconds
+        """
+        logger.debug("Broker health sampler thread initialized.")
+        next_sample = monotonic()
+        while True:
+            try:
+                health = self._query_broker(self.BROKER_HEALTH_TOPIC,
+                                            self.BROKER_HEALTH_TIMEOUT)
+                self._health_history.add(
+                    time.time(), float(health['incomingMessages']),
+                    float(health['outgoingMessages']),
+                    int(health['connectedClients']))
+            except Exception as ex:
+                logger.error("Error sampling broker health: %s", ex)
+            # Skip the samples that were missed (rather than catching up)
+            next_sample = max(next_sample + self.HEALTH_SAMPLE_INTERVAL,
+                              monotonic())
+            # The query may have overrun the interval since the time was read
+            time.sleep(max(0, next_sample - monotonic()))
+
+    def _query_broker(self, topic, timeout, broker_guid=None):
+        """
+        Sends a request to the specified broker topic and waits for its
+        response. This method blocks and is run on an executor.
+
+        :param topic: The request topic
+        :param timeout: The time (in seconds) to wait for the response
+        :param broker_guid: The GUID of the broker to send the request to,
+            ``None`` to target the connected broker
+        :return: The payload of the response (dict)
+        """
+        req = Request(topic)
+        if broker_guid:
+            req.broker_ids = [broker_guid]
+        MessageUtils.dict_to_json_payload(req, {})
+
+        dxl_response = self.app.bootstrap_app.client.sync_request(req, timeout)
+        if dxl_response.message_type == Message.MESSAGE_TYPE_ERROR:
+            raise Exception(
+                "Error invoking service with topic '{0}': {1} ({2})".format(
+                    topic, dxl_response.error_message, dxl_response.error_code))
+        return MessageUtils.json_payload_to_dict(dxl_response)
+
 
 class BrokerInfoHandler(BaseRequestHandler):
     """
@@ -84,68 +326,35 @@ class BrokerInfoHandler(BaseRequestHandler):
         """
         super(BrokerInfoHandler, self).__init__(application, request)
         self._module = module
-        self._bootstrap_app = application.bootstrap_app
 
     def data_received(self, chunk):
         pass
 
     @tornado.web.authenticated
+    @gen.coroutine
     def get(self, *args, **kwargs):
         """
-        Sends requests to get broker information (health and the broker registry topic)
+        Returns the broker information (see :meth:`BrokerModule.get_broker_info`)
         """
         try:
             response_wrapper = MonitorModule.create_smartclient_response_wrapper()
             # build the the response data
             response = response_wrapper["response"]
-            # the dxlclient for retrieving broker info
-            dxlclient = self._bootstrap_app.client
-
-            req = Request(BrokerModule.BROKER_REGISTRY_QUERY_TOPIC)
-            # targeting the connected broker
-            MessageUtils.dict_to_json_payload(req, {})
-
-            # Send the broker registry request
-            dxl_response = dxlclient.sync_request(req, 5)
-            if dxl_response.message_type != Message.MESSAGE_TYPE_ERROR:
-                dxl_response_dict = MessageUtils.json_payload_to_dict(
-                    dxl_response)
-            else:
-                err_msg = "Error invoking service with topic '{0}': {1} ({2})".format(
-                    BrokerModule.BROKER_REGISTRY_QUERY_TOPIC,
-                    dxl_response.error_message, dxl_response.error_code)
-                raise Exception(err_msg)
-
-            brokerinfo = list(dxl_response_dict['brokers'].values())[0]
-            # Send the broker health request
-            req = Request(BrokerModule.BROKER_HEALTH_TOPIC)
-            # targeting the connected broker
-            MessageUtils.dict_to_json_payload(req, {})
-            dxl_response = dxlclient.sync_request(req, 15)
-
-            if dxl_response.message_type != Message.MESSAGE_TYPE_ERROR:
-                dxl_response_dict = MessageUtils.json_payload_to_dict(
-                    dxl_response)
-            else:
-                err_msg = "Error invoking service with topic '{0}': {1} ({2})".format(
-                    BrokerModule.BROKER_HEALTH_TOPIC,
-                    dxl_response.error_message, dxl_response.error_code)
-                raise Exception(err_msg)
-
-            entry = {
-                "version": brokerinfo['version'],
-                "guid": brokerinfo['guid'],
-                "connectedClients": dxl_response_dict['connectedClients'],
-                "localServiceCounter": dxl_response_dict['localServiceCounter'],
-                "incomingMessages": dxl_response_dict['incomingMessages'],
-                "outgoingMessages": dxl_response_dict['outgoingMessages'],
-                "startTime": dxl_response_dict['startTime']
-            }
+
+            entry = yield self._module.get_broker_info()
             response["data"].append(entry)
             response['totalRows'] += 1
 
             self.write(json.dumps(response_wrapper))
 
+        except (gen.TimeoutError, WaitTimeoutException):
+            logger.error("Timed out waiting for broker info.")
+            response_wrapper = MonitorModule.create_smartclient_response_wrapper()
+            response_wrapper["response"]["status"] = -1
+            response_wrapper["response"]["data"] = \
+                "Timed out waiting for the broker to respond."
+            self.write(json.dumps(response_wrapper))
+
         except Exception as ex:
             logger.error(
                 "Exception while processing broker info request. %s", ex)
@@ -153,3 +362,96 @@ class BrokerInfoHandler(BaseRequestHandler):
             self.set_status(500)
             self.write(
                 u"""{response:{status:0,startRow:0,endRow:0,totalRows:0,data:[]}}""")
+
+
+class BrokerHistoryHandler(BaseRequestHandler):
+    """
+    Handles requests to get the history of the broker health (message rates
+    and connected clients)
+    """
+
+    def __init__(self, application, request, module):
+        """
+        Constructor parameters:
+
+        :param application: The application associated with the request handler
+        :param request: The request
+        :param module: The module this request handler is associated with
+        """
+        super(BrokerHistoryHandler, self).__init__(application, request)
+        self._module = module
+
+    def data_received(self, chunk):
+        pass
+
+    @tornado.web.authenticated
+    def get(self, *args, **kwargs):
+        """
+        Returns the broker health samples, newest first. The optional
+        ``minutes`` argument limits the samples to those taken in the specified
+        number of most recent minutes.
+        """
+        since = None
+        minutes = self.get_query_argument("minutes", None)
+        if minutes:
+            try:
+                since = time.time() - float(minutes) * 60
+            except ValueError:
+                pass
+            # Raised outside of the handler, as the parse error is not of
+            # interest (and "raise ... from None" is not valid in Python 2)
+            if since is None:
+                raise tornado.web.HTTPError(400, "Invalid minutes: " + minutes)
+
+        response_wrapper = MonitorModule.create_smartclient_response_wrapper()
+        response = response_wrapper["response"]
+        response["data"] = self._module.get_broker_history(since)
+        response["endRow"] = len(response["data"])
+        response["totalRows"] = len(response["data"])
+
+        self.write(json.dumps(response_wrapper))
+
+
+class FabricInfoHandler(BaseRequestHandler):
+    """
+    Handles requests to get the information for every broker of the fabric
+    """
+
+    def __init__(self, application, request, module):
+        """
+        Constructor parameters:
+
+        :param application: The application associated with the request handler
+        :param request: The request
+        :param module: The module this request handler is associated with
+        """
+        super(FabricInfoHandler, self).__init__(application, request)
+        self._module = module
+
+    def data_received(self, chunk):
+        pass
+
+    @tornado.web.authenticated
+    @gen.coroutine
+    def get(self, *args, **kwargs):
+        """
+        Returns the broker information (see :meth:`BrokerModule.get_fabric_info`)
+        """
+        response_wrapper = MonitorModule.create_smartclient_response_wrapper()
+        response = response_wrapper["response"]
+        try:
+            response["data"] = yield self._module.get_fabric_info()
+            response["endRow"] = len(response["data"])
+            response["totalRows"] = len(response["data"])
+        except (gen.TimeoutError, WaitTimeoutException):
+            logger.error("Timed out waiting for the broker registry.")
+            response["status"] = -1
+            response["data"] = "Timed out waiting for the broker registry to respond."
+        except Exception as ex:
+            logger.error(
+                "Exception while processing fabric info request. %s", ex)
+            logger.error(traceback.format_exc())
+            response["status"] = -1
+            response["data"] = "Failed to retrieve the fabric information: " + str(ex)
+
+        self.write(json.dumps(response_wrapper))
@@ -0,0 +1,467 @@
+from __future__ import absolute_import
+import logging
+import threading
+
+from dxlclient.callbacks import EventCallback, ResponseCallback
+from dxlclient.client import DxlClient
+from dxlclient.exceptions import DxlException
+
+from .lru_cache import LruCache
+from .message_record import MessageRecord
+from .request_tracker import RequestTracker
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+class DxlClientMultiplexer(object):
+    """
+    Shares a single :class:`dxlclient.client.DxlClient` connection between the
+    console "sessions" (browser tabs).
+
+    Subscriptions are reference-counted per topic: the shared client
+    subscribes to a topic when the first session subscribes to it and
+    unsubscribes when the last session unsubscribes. Incoming events are fanned
+    out to each session subscribed to the event's topic (directly or via a
+    wildcard), and responses are routed back to the session that sent the
+    corresponding request by request message identifier. A single
+    :class:`MessageRecord` is created for each message, which is delivered to
+    the :class:`SessionMessageCallback` of each receiving session.
+
+    Requests awaiting a response are tracked (see :class:`RequestTracker`)
+    for a limited time (and up to a maximum number), so that requests that
+    are never responded to do not accumulate. The tracker also records the
+    topic of each request, which is displayed for its response in place of
+    the response channel, and the time it was sent.
+    """
+
+    # The number of recently received event identifiers retained to suppress
+    # duplicate deliveries caused by overlapping subscriptions
+    _RECENT_EVENT_CACHE_SIZE = 1000
+
+    # The errors raised by the DXL client when connecting while it is already
+    # connected or connecting (e.g. automatically reconnecting)
+    _CONNECT_IN_PROGRESS_ERRORS = ("Already connected", "Already trying to connect")
+
+    def __init__(self, client_config, request_capacity, request_ttl):
+        """
+        Constructor parameters:
+
+        :param client_config: The :class:`dxlclient.client_config.DxlClientConfig`
+            for the shared client
+        :param request_capacity: The maximum number of requests awaiting a
+            response that are tracked
+        :param request_ttl: The time (in seconds) a request awaiting a response
+            is tracked for after it is sent
+        """
+        self._client = DxlClient(client_config)
+
+        # Serializes connecting the shared client
+        self._connect_lock = threading.Lock()
+        # Serializes subscription changes (which wait on the broker)
+        self._subscription_lock = threading.Lock()
+        # Protects the session tables below
+        self._lock = threading.Lock()
+
+        # topic -> frozenset of session ids. Replaced (never mutated) on change
+        # so that events can be fanned out without acquiring a lock.
+        self._topic_sessions = {}
+        # session id -> set of topics
+        self._session_topics = {}
+        # session id -> message callback. Replaced (never mutated) on change,
+        # like the topic sessions.
+        self._session_callbacks = {}
+        # the requests awaiting a response, by request message id
+        self._requests = RequestTracker(request_capacity, request_ttl)
+
+        self._recent_event_ids = LruCache(self._RECENT_EVENT_CACHE_SIZE)
+
+        self._client.add_event_callback(None, _MultiplexerEventCallback(self),
+                                        subscribe_to_topic=False)
+        self._client.add_response_callback(None,
+                                           _MultiplexerResponseCallback(self))
+
+    @property
+    def client(self):
+        """
+        Returns the shared DXL client
+
+        :return: The shared :class:`dxlclient.client.DxlClient`
+        """
+        return self._client
+
+    def connect(self):
+        """
+        Connects the shared DXL client to the fabric if it is not connected.
+        A connect that is already in progress (the client reconnects
+        automatically after losing its connection) is not treated as an error.
+        """
+        with self._connect_lock:
+            if self._client.connected:
+                return
+            try:
+                self._client.connect()
+            except DxlException as ex:
+                if str(ex) not in self._CONNECT_IN_PROGRESS_ERRORS:
+                    raise
+                logger.debug("Shared client is already connecting: %s", ex)
+
+    def session_client(self, session_id):
+        """
+        Returns a client bound to the given session
+
+        :param session_id: The session identifier
+        :return: The :class:`SessionClient` for the session
+        """
+        return SessionClient(self, session_id)
+
+    def subscribe(self, session_id, topic):
+        """
+        Subscribes the given session to the specified topic
+
+        :param session_id: The session identifier
+        :param topic: The topic to subscribe to
+        """
+        with self._subscription_lock:
+            with self._lock:
+                session_topics = self._session_topics.setdefault(session_id, set())
+                if topic in session_topics:
+                    return
+                sessions = self._topic_sessions.get(topic, frozenset())
+                first_subscriber = not sessions
+
+            if first_subscriber:
+                logger.debug("Subscribing shared client to topic: %s", topic)
+                self._client.subscribe(topic)
+
+            with self._lock:
+                session_topics.add(topic)
+                topic_sessions = dict(self._topic_sessions)
+                topic_sessions[topic] = sessions | frozenset([session_id])
+                self._topic_sessions = topic_sessions
+
+    def unsubscribe(self, session_id, topic):
+        """
+        Unsubscribes the given session from the specified topic
+
+        :param session_id: The session identifier
+        :param topic: The topic to unsubscribe from
+        """
+        with self._subscription_lock:
+            self._unsubscribe(session_id, topic)
+
+    def _unsubscribe(self, session_id, topic):
+        """
+        Unsubscribes the given session from the specified topic. The caller
+        must hold the subscription lock.
+
+        :param session_id: The session identifier
+        :param topic: The topic to unsubscribe from
+        """
+        with self._lock:
+            session_topics = self._session_topics.get(session_id)
+            if not session_topics or topic not in session_topics:
+                return
+            session_topics.discard(topic)
+            sessions = self._topic_sessions.get(topic, frozenset()) - \
+                frozenset([session_id])
+            topic_sessions = dict(self._topic_sessions)
+            if sessions:
+                topic_sessions[topic] = sessions
+            else:
+                topic_sessions.pop(topic, None)
+            self._topic_sessions = topic_sessions
+
+        if not sessions:
+            logger.debug("Unsubscribing shared client from topic: %s", topic)
+            self._client.unsubscribe(topic)
+
+    def release_session(self, session_id):
+        """
+        Releases all of the resources held on behalf of the given session:
+        its subscriptions (unsubscribing the shared client from topics no other
+        session is subscribed to), callbacks and outstanding requests.
+
+        :param session_id: The session identifier
+        :return: ``True`` if all of the session's resources were released,
+            ``False`` if the shared client failed to unsubscribe from a topic
+        """
+        released = True
+        with self._subscription_lock:
+            for topic in self.subscriptions(session_id):
+                try:
+                    self._unsubscribe(session_id, topic)
+                except Exception as ex:
+                    logger.error("Error unsubscribing from topic '%s' for "
+                                 "session %s: %s", topic, session_id, ex)
+                    released = False
+
+            with self._lock:
+                self._session_topics.pop(session_id, None)
+                self._remove_session_callbacks(session_id)
+            self._requests.discard_session(session_id)
+        return released
+
+    def subscriptions(self, session_id):
+        """
+        Returns the topics the given session is subscribed to
+
+        :param session_id: The session identifier
+        :return: A tuple containing the topics the session is subscribed to
+        """
+        with self._lock:
+            return tuple(self._session_topics.get(session_id, ()))
+
+    def async_request(self, session_id, request):
+        """
+        Sends the specified request, routing its response to the given session
+
+        :param session_id: The session identifier
+        :param request: The request to send
+        """
+        self._requests.track(request.message_id, request.destination_topic,
+                             session_id)
+        try:
+            self._client.async_request(request)
+        except Exception:
+            self._requests.pop(request.message_id)
+            raise
+
+    def send_event(self, event):
+        """
+        Sends the specified event
+
+        :param event: The event to send
+        """
+        self._client.send_event(event)
+
+    def set_session_callback(self, session_id, callback):
+        """
+        Sets the callback that receives the events and responses for the
+        given session
+
+        :param session_id: The session identifier
+        :param callback: The :class:`SessionMessageCallback`
+        """
+        with self._lock:
+            session_callbacks = dict(self._session_callbacks)
+            session_callbacks[session_id] = callback
+            self._session_callbacks = session_callbacks
+
+    def clear_session_callback(self, session_id, callback):
+        """
+        Removes the given callback for the given session, unless it has since
+        been replaced by another (e.g. that of a newer web socket for the
+        session)
+
+        :param session_id: The session identifier
+        :param callback: The :class:`SessionMessageCallback`
+        """
+        with self._lock:
+            if self._session_callbacks.get(session_id) is callback:
+                self._remove_session_callbacks(session_id)
+
+    def _remove_session_callbacks(self, session_id):
+        """
+        Removes the callback for the given session. The caller must hold the
+        lock.
+
+        :param session_id: The session identifier
+        """
+        if session_id in self._session_callbacks:
+            session_callbacks = dict(self._session_callbacks)
+            del session_callbacks[session_id]
+            self._session_callbacks = session_callbacks
+
+    def _on_event(self, event):
+        """
+        Fans the specified event out to the sessions subscribed to its topic
+
+        :param event: The incoming event
+        """
+        if self._recent_event_ids.get(event.message_id):
+            return
+        self._recent_event_ids.put(event.message_id, True)
+
+        topic_sessions = self._topic_sessions
+        topic = event.destination_topic
+        sessions = set(topic_sessions.get(topic, ()))
+        for wildcard in _topic_wildcards(topic):
+            sessions.update(topic_sessions.get(wildcard, ()))
+        if not sessions:
+            return
+
+        callbacks = self._session_callbacks
+        record = None
+        for session_id in sessions:
+            callback = callbacks.get(session_id)
+            if callback:
+                if record is None:
+                    record = MessageRecord(event, topic)
+                callback.on_message(record)
+
+    def _on_response(self, response):
+        """
+        Routes the specified response to the session that sent the request,
+        along with the topic and round-trip latency of the request
+
+        :param response: The incoming response
+        """
+        request = self._requests.pop(response.request_message_id)
+        if request is None:
+            return
+        topic, session_id, latency = request
+        callback = self._session_callbacks.get(session_id)
+        if callback:
+            callback.on_message(MessageRecord(response, topic, latency))
+
+
+class SessionClient(object):
+    """
+    A view of the shared DXL client that is bound to a single console
+    "session". It exposes the subset of the :class:`dxlclient.client.DxlClient`
+    operations used by the monitor handlers.
+    """
+
+    def __init__(self, multiplexer, session_id):
+        """
+        Constructor parameters:
+
+        :param multiplexer: The :class:`DxlClientMultiplexer`
+        :param session_id: The session identifier
+        """
+        self._multiplexer = multiplexer
+        self._session_id = session_id
+
+    @property
+    def session_id(self):
+        """
+        Returns the session identifier
+
+        :return: The session identifier
+        """
+        return self._session_id
+
+    @property
+    def subscriptions(self):
+        """
+        A tuple containing the topics that the session is subscribed to
+        """
+        return self._multiplexer.subscriptions(self._session_id)
+
+    def subscribe(self, topic):
+        """
+        Subscribes the session to the specified topic
+
+        :param topic: The topic to subscribe to
+        """
+        self._multiplexer.subscribe(self._session_id, topic)
+
+    def unsubscribe(self, topic):
+        """
+        Unsubscribes the session from the specified topic
+
+        :param topic: The topic to unsubscribe from
+        """
+        self._multiplexer.unsubscribe(self._session_id, topic)
+
+    def send_event(self, event):
+        """
+        Sends the specified event
+
+        :param event: The event to send
+        """
+        self._multiplexer.send_event(event)
+
+    def async_request(self, request):
+        """
+        Sends the specified request, its response is delivered to the response
+        callback of the session
+
+        :param request: The request to send
+        """
+        self._multiplexer.async_request(self._session_id, request)
+
+    def set_callback(self, callback):
+        """
+        Sets the callback that receives the events and responses for the
+        session
+
+        :param callback: The :class:`SessionMessageCallback`
+        """
+        self._multiplexer.set_session_callback(self._session_id, callback)
+
+    def clear_callback(self, callback):
+        """
+        Removes the given callback for the session, unless it has since been
+        replaced by another
+
+        :param callback: The :class:`SessionMessageCallback`
+        """
+        self._multiplexer.clear_session_callback(self._session_id, callback)
+
+    def release(self):
+        """
+        Releases the subscriptions, callbacks and outstanding requests of the
+        session
+
+        :return: ``True`` if all of the session's resources were released
+        """
+        return self._multiplexer.release_session(self._session_id)
+
+
+class SessionMessageCallback(object):
+    """
+    Receives the events and responses delivered to a console "session" by the
+    :class:`DxlClientMultiplexer`
+    """
+
+    def on_message(self, message):
+        """
+        Invoked (on a DXL client thread) when an event or response is received
+        for the session
+
+        :param message: The :class:`MessageRecord` for the event or response,
+            shared with the other sessions receiving the message
+        """
+        raise NotImplementedError()
+
+
+class _MultiplexerEventCallback(EventCallback):
+    """
+    A DXL event callback that fans events out to the subscribed sessions
+    """
+
+    def __init__(self, multiplexer):
+        super(_MultiplexerEventCallback, self).__init__()
+        self._multiplexer = multiplexer
+
+    def on_event(self, event):
+        self._multiplexer._on_event(event) # pylint: disable=protected-access
+
+
+class _MultiplexerResponseCallback(ResponseCallback):
+    """
+    A DXL response callback that routes responses to the requesting session
+    """
+
+    def __init__(self, multiplexer):
+        super(_MultiplexerResponseCallback, self).__init__()
+        self._multiplexer = multiplexer
+
+    def on_response(self, response):
+        self._multiplexer._on_response(response) # pylint: disable=protected-access
+
+
+def _topic_wildcards(topic):
+    """
+    Returns the wildcard subscriptions that match the specified topic, i.e.
+    ``/foo/bar/baz`` -> ``/foo/bar/#``, ``/foo/#``, ``/#``, ``#``
+
+    :param topic: The topic
+    :return: A list of the matching wildcard subscriptions
+    """
+    parts = topic.split("/")
+    wildcards = ["/".join(parts[:i]) + "/#" for i in range(len(parts) - 1, 0, -1)]
+    wildcards.append("#")
+    return wildcards
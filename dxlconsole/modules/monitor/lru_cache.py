@@ -0,0 +1,56 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+import threading
+
+
+class LruCache(object):
+    """
+    A thread-safe, fixed-capacity cache that evicts the least recently used
+    entry when full.
+    """
+
+    def __init__(self, capacity):
+        """
+        Constructor parameters:
+
+        :param capacity: The maximum number of entries retained by the cache
+        """
+        if capacity < 1:
+            raise ValueError("Cache capacity must be at least 1")
+        self._capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for the given key, marking it as the most
+        recently used entry
+
+        :param key: The key
+        :param default: The value to return if the key is not in the cache
+        :return: The value stored for the key or ``default``
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value = self._entries.pop(key)
+            self._entries[key] = value
+            return value
+
+    def put(self, key, value):
+        """
+        Stores the value for the given key as the most recently used entry,
+        evicting the least recently used entry if the cache is full
+
+        :param key: The key
+        :param value: The value
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            if len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,188 @@
+from __future__ import absolute_import
+import logging
+
+import tornado
+from dxlbootstrap.util import MessageUtils
+from dxlclient import Message, json
+
+from dxlconsole.handlers import BaseRequestHandler
+from .messages_handler import MessagesHandler
+from .payload_formatter import PayloadFormatter
+
+logger = logging.getLogger(__name__)
+
+
+class MessageDetailHandler(BaseRequestHandler):
+    """
+    Handles fetch requests for the details (pretty-printed payload, etc.) of a
+    single received message. Details are rendered on demand from the message
+    retained by the session's message store and cached by message identifier.
+    """
+
+    # The max size to send down for the details payload
+    _MAX_DETAILS_PAYLOAD_LENGTH = 10000
+
+    # The max number of bytes of a binary payload to include in the hex dump
+    _MAX_DETAILS_BINARY_LENGTH = 1024
+
+    def __init__(self, application, request, module):
+        """
+        Constructor parameters:
+
+        :param application: The application associated with the request handler
+        :param request: The request
+        :param module: The module this request handler is associated with
+        """
+        super(MessageDetailHandler, self).__init__(application, request)
+        self._module = module
+
+    def data_received(self, chunk):
+        """
+        Invoked when streamed request data is received
+
+        :param: chunk The next chuck of data
+        """
+        pass
+
+    @classmethod
+    def create_message_detail(cls, message):
+        """
+        Renders the details for the given received message. The payload is
+        rendered by the renderer for its type, it is truncated to the maximum
+        details length prior to being parsed.
+
+        :param message: The :class:`MessageRecord` for the received message
+        :return: The message details (dict)
+        """
+        escape = MessagesHandler.escape
+        if message.message_type == Message.MESSAGE_TYPE_ERROR:
+            payload = escape(message.error_message + " (" + str(
+                message.error_code) + ")")
+        else:
+            detail_payload = message.detail_payload
+            payload_type = message.payload_type
+            if payload_type == PayloadFormatter.PAYLOAD_TYPE_BINARY:
+                payload = cls._render_binary_payload(
+                    detail_payload, message.payload_length)
+            else:
+                # Truncate prior to parsing, a truncated JSON payload is
+                # displayed as text
+                truncated = message.payload_length > cls._MAX_DETAILS_PAYLOAD_LENGTH
+                decoded_payload = detail_payload[
+                    0:cls._MAX_DETAILS_PAYLOAD_LENGTH].decode("utf-8", "replace")
+                if payload_type == PayloadFormatter.PAYLOAD_TYPE_JSON and \
+                        not truncated:
+                    payload = cls._render_json_payload(decoded_payload)
+                elif payload_type == PayloadFormatter.PAYLOAD_TYPE_XML:
+                    payload, xml_truncated = cls._render_xml_payload(
+                        decoded_payload)
+                    truncated = truncated or xml_truncated
+                else:
+                    payload = cls._render_text_payload(decoded_payload)
+                if truncated:
+                    payload += " ..."
+
+        return {
+            'id': message.message_id,
+            'payload': payload,
+            'otherFields': "<pre><code>" +
+                           escape(MessageUtils.dict_to_json(
+                               message.other_fields or {}, True)) +
+                           "</pre></code>"
+        }
+
+    @classmethod
+    def _render_json_payload(cls, decoded_payload):
+        """
+        Renders a JSON payload, falling back to text if it can not be parsed
+
+        :param decoded_payload: The decoded payload
+        :return: The rendered payload (HTML)
+        """
+        try:
+            return "<pre><code>" + \
+                   MessagesHandler.escape(MessageUtils.dict_to_json(
+                       json.loads(decoded_payload), True)) + \
+                   "</pre></code>"
+        except ValueError:
+            return cls._render_text_payload(decoded_payload)
+
+    @classmethod
+    def _render_xml_payload(cls, decoded_payload):
+        """
+        Renders an XML payload
+
+        :param decoded_payload: The decoded payload
+        :return: A tuple containing the rendered payload (HTML) and whether
+            the formatted payload was truncated
+        """
+        xml_payload, truncated = PayloadFormatter.prettify_xml(
+            decoded_payload, cls._MAX_DETAILS_PAYLOAD_LENGTH)
+        return "<pre lang='xml'><code>" + \
+               MessagesHandler.escape(xml_payload) + "</code></pre>", truncated
+
+    @staticmethod
+    def _render_text_payload(decoded_payload):
+        """
+        Renders a textual payload
+
+        :param decoded_payload: The decoded payload
+        :return: The rendered payload (HTML)
+        """
+        return "<pre><code>" + MessagesHandler.escape(decoded_payload) + \
+               "</code></pre>"
+
+    @classmethod
+    def _render_binary_payload(cls, payload, payload_length):
+        """
+        Renders a binary payload as a hex dump of its leading bytes
+
+        :param payload: The payload (bytes), or a prefix of it
+        :param payload_length: The full length of the payload
+        :return: The rendered payload (HTML)
+        """
+        rendered = "Binary payload (" + str(payload_length) + " bytes)" + \
+                   "<pre><code>" + MessagesHandler.escape(
+                       PayloadFormatter.hex_dump(
+                           payload, cls._MAX_DETAILS_BINARY_LENGTH)) + \
+                   "</code></pre>"
+        if payload_length > cls._MAX_DETAILS_BINARY_LENGTH:
+            rendered += " ..."
+        return rendered
+
+    @tornado.web.authenticated
+    def get(self, *args, **kwargs):
+        """HTTP GET"""
+        message_id = self.get_query_argument("id", None)
+        if not message_id:
+            self.write(self._module.create_smartclient_error_response(
+                "No message ID sent with request."))
+            return
+
+        client_id = self.get_query_argument("clientId", "null")
+        if client_id == "null":
+            self.write(self._module.create_smartclient_error_response(
+                "No client ID sent with request."))
+            return
+
+        # The message store is the authority on which messages are available,
+        # the cache only saves rendering the details again
+        message = self._module.get_message_record(client_id, message_id)
+        if message is None:
+            self.write(self._module.create_smartclient_error_response(
+                "Details are no longer available for message: " + message_id))
+            return
+
+        detail = self._module.message_details.get(message_id)
+        if detail is None:
+            detail = self.create_message_detail(message)
+            self._module.message_details.put(message_id, detail)
+
+        response_wrapper = self._module.create_smartclient_response_wrapper()
+        response = response_wrapper["response"]
+        response["data"].append(detail)
+        response["totalRows"] = 1
+
+        logger.debug(
+            "Message detail handler response: %s", json.dumps(response_wrapper))
+        self.write(response_wrapper)
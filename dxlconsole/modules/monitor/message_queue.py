@@ -0,0 +1,51 @@
+from __future__ import absolute_import
+from collections import deque
+
+
+class MessageQueue(object):
+    """
+    A fixed-capacity (ring buffer) queue of messages pending delivery to a
+    single console "session". When the queue is full, the oldest message is
+    dropped to make room for the newest one and the drop is counted.
+
+    This class is not thread-safe, callers are responsible for synchronizing
+    access to it.
+    """
+
+    def __init__(self, capacity):
+        """
+        Constructor parameters:
+
+        :param capacity: The maximum number of messages retained by the queue
+        """
+        if capacity < 1:
+            raise ValueError("Message queue capacity must be at least 1")
+        self._messages = deque(maxlen=capacity)
+        self._dropped_count = 0
+
+    @property
+    def dropped_count(self):
+        """
+        Returns the number of messages that have been dropped because the
+        queue was full
+
+        :return: The number of messages that have been dropped
+        """
+        return self._dropped_count
+
+    def append(self, message):
+        """
+        Adds the given message to the queue, dropping the oldest message if
+        the queue is full
+
+        :param message: The message to add
+        """
+        if len(self._messages) == self._messages.maxlen:
+            self._dropped_count += 1
+        self._messages.append(message)
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __iter__(self):
+        return iter(self._messages)
@@ -0,0 +1,106 @@
+from __future__ import absolute_import
+import time
+import zlib
+
+from ..._compat import monotonic
+from .payload_formatter import PayloadFormatter
+
+
+class MessageRecord(object):
+    """
+    A compact record of a DXL message received by the console, retained in
+    place of the :class:`dxlclient.message.Message` until it is displayed and
+    while it is in the messages grid (for its details). A single record is
+    created for each received message and shared by the sessions that receive
+    it, it must not be modified.
+
+    The record exposes the subset of the message attributes used to render
+    the message (``message_id``, ``message_type``, ``payload``, etc.). The
+    payload is classified once, as ``payload_type``. Only a short preview of
+    a textual payload is retained as ``payload``, enough to render the
+    messages grid. The longer prefix rendered in the message details is
+    retained compressed and is decompressed on demand (see
+    :attr:`detail_payload`). A binary payload does not compress and only its
+    hex dump is rendered in the details, so just the prefix that is dumped is
+    retained (as ``payload``). The full length of the payload is available as
+    ``payload_length``.
+    """
+
+    #: The maximum number of leading payload bytes retained as the preview,
+    #: enough to classify the payload and render the messages grid
+    MAX_PREVIEW_LENGTH = 512
+
+    #: The maximum number of leading payload bytes retained for the details,
+    #: enough for the longest payload rendered
+    MAX_PAYLOAD_LENGTH = 10000
+
+    #: The maximum number of leading bytes of a binary payload retained for
+    #: the details, enough for the hex dump rendered
+    MAX_BINARY_PAYLOAD_LENGTH = 1024
+
+    # The zlib compression level of the details payload (favoring speed, as
+    # messages are recorded on the DXL callback threads)
+    _COMPRESSION_LEVEL = 1
+
+    __slots__ = ("topic", "message_id", "message_type", "source_broker_id",
+                 "source_client_id", "payload", "payload_type", "payload_length",
+                 "error_message", "error_code", "other_fields", "latency",
+                 "received", "_compressed_payload")
+
+    def __init__(self, message, topic, latency=None):
+        """
+        Constructor parameters:
+
+        :param message: The received :class:`dxlclient.message.Message`
+        :param topic: The topic to display for the message
+        :param latency: The round-trip latency (in milliseconds) of a response
+            to a request sent by the console, or ``None``
+        """
+        self.topic = topic
+        self.message_id = message.message_id
+        self.message_type = message.message_type
+        self.source_broker_id = message.source_broker_id
+        self.source_client_id = message.source_client_id
+        self.payload = message.payload[0:self.MAX_PREVIEW_LENGTH]
+        self.payload_type = PayloadFormatter.sniff_payload_type(self.payload)
+        self.payload_length = len(message.payload)
+        if self.payload_type == PayloadFormatter.PAYLOAD_TYPE_BINARY:
+            self.payload = message.payload[0:self.MAX_BINARY_PAYLOAD_LENGTH]
+            self._compressed_payload = None
+        elif self.payload_length > self.MAX_PREVIEW_LENGTH:
+            # The prefix rendered in the details, longer than the preview
+            self._compressed_payload = zlib.compress(
+                message.payload[0:self.MAX_PAYLOAD_LENGTH],
+                self._COMPRESSION_LEVEL)
+        else:
+            self._compressed_payload = None
+        self.error_message = getattr(message, "error_message", None)
+        self.error_code = getattr(message, "error_code", None)
+        # The other fields are rendered in the details and can not be
+        # retrieved later, most messages have none so no dictionary is kept
+        self.other_fields = message.other_fields or None
+        self.latency = latency
+        #: The (monotonic) time the message was received
+        self.received = monotonic()
+
+    @property
+    def detail_payload(self):
+        """
+        Returns the leading bytes of the payload rendered in the message
+        details
+
+        :return: Up to :attr:`MAX_PAYLOAD_LENGTH` leading bytes of the
+            payload (:attr:`MAX_BINARY_PAYLOAD_LENGTH` for a binary payload)
+        """
+        if self._compressed_payload is None:
+            return self.payload
+        return zlib.decompress(self._compressed_payload)
+
+    @property
+    def received_time(self):
+        """
+        Returns the (wall clock) time the message was received
+
+        :return: The time the message was received (seconds since the epoch)
+        """
+        return time.time() - (monotonic() - self.received)
@@ -0,0 +1,179 @@
+from __future__ import absolute_import
+from collections import OrderedDict, deque
+import heapq
+
+
+class MessageStore(object):
+    """
+    A fixed-capacity store of the messages captured for a single console
+    "session", serving the pages, sort orders and filters requested by the
+    SmartClient messages grid. When the store is full, the oldest message is
+    evicted to make room for the newest one.
+
+    Messages are stored as grid entries (dicts), in the order they were
+    captured. The entries are indexed by topic and by type so that the most
+    common filters do not need to examine every message. The record of each
+    message is retained alongside its entry (by message identifier), so that
+    its details can be rendered for as long as it is in the grid.
+
+    This class is not thread-safe, callers are responsible for synchronizing
+    access to it.
+    """
+
+    #: The entry fields that are indexed (filtered by exact match)
+    INDEXED_FIELDS = ("topic", "type")
+
+    #: The entry field holding the time the message was received, sorting by
+    #: this field is equivalent to sorting by capture order
+    RECEIVED_FIELD = "received"
+
+    def __init__(self, capacity):
+        """
+        Constructor parameters:
+
+        :param capacity: The maximum number of messages retained by the store
+        """
+        if capacity < 1:
+            raise ValueError("Message store capacity must be at least 1")
+        self._capacity = capacity
+        # sequence number -> entry, in capture order
+        self._entries = OrderedDict()
+        self._next_sequence = 0
+        # field -> value -> deque of sequence numbers (in capture order)
+        self._indices = dict((field, {}) for field in self.INDEXED_FIELDS)
+        # message id -> (sequence number, record)
+        self._records = {}
+
+    def add(self, entry, record=None):
+        """
+        Adds the given entry to the store, evicting the oldest entry if the
+        store is full
+
+        :param entry: The entry (dict) for the message
+        :param record: The :class:`MessageRecord` for the message, retained
+            for rendering its details
+        """
+        sequence = self._next_sequence
+        self._next_sequence += 1
+        self._entries[sequence] = entry
+        for field, index in self._indices.items():
+            index.setdefault(entry.get(field), deque()).append(sequence)
+        if record is not None:
+            self._records[entry.get("id")] = (sequence, record)
+
+        if len(self._entries) > self._capacity:
+            evicted_sequence, evicted = self._entries.popitem(last=False)
+            # The record may have been replaced by a later message with the
+            # same identifier
+            evicted_id = evicted.get("id")
+            if self._records.get(evicted_id, (None,))[0] == evicted_sequence:
+                del self._records[evicted_id]
+            # The evicted entry is the oldest, so it is first in its indices
+            for field, index in self._indices.items():
+                value = evicted.get(field)
+                sequences = index[value]
+                sequences.popleft()
+                if not sequences:
+                    del index[value]
+
+    def get_record(self, message_id):
+        """
+        Returns the record of the message with the given identifier
+
+        :param message_id: The message identifier
+        :return: The :class:`MessageRecord` for the message or ``None`` if the
+            message is not in the store
+        """
+        sequence_record = self._records.get(message_id)
+        return sequence_record[1] if sequence_record is not None else None
+
+    def query(self, start_row, end_row, sort_by=None, criteria=None):
+        """
+        Returns a page of the entries that match the given criteria, in the
+        given sort order
+
+        :param start_row: The index of the first entry to return
+        :param end_row: The index after the last entry to return, ``None`` to
+            return all of the remaining entries
+        :param sort_by: A list of the fields to sort by, most significant
+            first. A field prefixed with ``-`` is sorted in descending order.
+            By default, entries are returned in capture order.
+        :param criteria: A dictionary of field -> value (or list of values).
+            Indexed fields must match one of the values exactly, other fields
+            must contain the value (ignoring case).
+        :return: A tuple containing the total number of entries that match
+            the criteria and the list of entries in the page
+        """
+        matches = self._select(criteria or {})
+
+        # Apply the least significant sort first, relying on sort stability
+        for field in reversed(sort_by or []):
+            descending = field.startswith("-")
+            field = field.lstrip("-")
+            if field == self.RECEIVED_FIELD:
+                matches.sort(key=lambda match: match[0], reverse=descending)
+            else:
+                matches.sort(key=lambda match, field=field:
+                             _sort_key(match[1].get(field)),
+                             reverse=descending)
+
+        return len(matches), [entry for _, entry in matches[start_row:end_row]]
+
+    def _select(self, criteria):
+        """
+        Returns the entries that match the given criteria
+
+        :param criteria: A dictionary of field -> value (or list of values)
+        :return: A list of (sequence number, entry) tuples in capture order
+        """
+        indexed_criteria = []
+        other_criteria = []
+        for field, values in criteria.items():
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            if field in self._indices:
+                indexed_criteria.append((field, values))
+            else:
+                other_criteria.append(
+                    (field, [(u"%s" % value).lower() for value in values]))
+
+        if indexed_criteria:
+            # Visit the entries of the most selective index, checking the
+            # remaining criteria against each entry
+            candidates = []
+            for field, values in indexed_criteria:
+                index = self._indices[field]
+                sequences = [index[value] for value in set(values) if value in index]
+                candidates.append((sum(len(seq) for seq in sequences), field, sequences))
+            _, index_field, sequences = min(candidates, key=lambda c: c[0])
+            selected = ((sequence, self._entries[sequence])
+                        for sequence in heapq.merge(*sequences))
+        else:
+            index_field = None
+            selected = self._entries.items()
+
+        matches = []
+        for sequence, entry in selected:
+            if all(entry.get(field) in values
+                   for field, values in indexed_criteria if field != index_field) and \
+                    all(any(value in (u"%s" % entry.get(field, u"")).lower()
+                            for value in values)
+                        for field, values in other_criteria):
+                matches.append((sequence, entry))
+        return matches
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _sort_key(value):
+    """
+    Returns a key that orders the given entry field value: numbers before
+    (and separately from) other values, which are ordered as text
+
+    :param value: The field value
+    :return: The sort key
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 0, value, u""
+    return 1, 0, u"" if value is None else u"%s" % value
@@ -2,26 +2,34 @@ from __future__ import absolute_import
 import logging
 
 import tornado
-from bs4 import BeautifulSoup
-from dxlbootstrap.util import MessageUtils
 from dxlclient import Message, json
 
 from dxlconsole.handlers import BaseRequestHandler
+from .payload_formatter import PayloadFormatter
 
 logger = logging.getLogger(__name__)
 
 
 class MessagesHandler(BaseRequestHandler):
     """
-    Handles fetch requests for pending messages.
+    Handles fetch requests for the messages grid. Pending messages are moved
+    into the session's :class:`MessageStore`, which serves the requested page
+    (``_startRow``/``_endRow``), sort order (``_sortBy``) and filter criteria.
     """
 
-    # The max size to send down for the details payload
-    _MAX_DETAILS_PAYLOAD_LENGTH = 10000
+    # The entry fields that may be used as filter criteria
+    _CRITERIA_FIELDS = ("topic", "id", "type", "sourceBroker", "sourceClient",
+                        "originalPayload")
+
+    # The time a message was received is sent as milliseconds since the
+    # epoch, which the client converts to a date
 
     # The max size to send down for the table payload
     _MAX_TABLE_PAYLOAD_LENGTH = 500
 
+    # The max number of bytes of a binary payload to preview in the table
+    _MAX_TABLE_BINARY_LENGTH = 32
+
     def __init__(self, application, request, module):
         """
         Constructor parameters:
@@ -51,6 +59,95 @@ class MessagesHandler(BaseRequestHandler):
             .replace('"', '&quot;') \
             .replace("'", ' &#39;')
 
+    @classmethod
+    def create_message_entry(cls, message):
+        """
+        Renders the given received message as an entry for the SmartClient
+        messages grid. Only a truncated payload is included, the message is
+        retained by the message store so that its details can be rendered on
+        demand (see :class:`MessageDetailHandler`).
+
+        :param message: The :class:`MessageRecord` for the received message
+        :return: The message entry (dict)
+        """
+        if message.message_type == Message.MESSAGE_TYPE_ERROR:
+            original_payload = message.error_message + " (" + str(
+                message.error_code) + ")"
+        elif message.payload_type == PayloadFormatter.PAYLOAD_TYPE_BINARY:
+            original_payload = "Binary payload (" + \
+                               str(message.payload_length) + " bytes): " + \
+                               PayloadFormatter.hex_preview(
+                                   message.payload,
+                                   cls._MAX_TABLE_BINARY_LENGTH)
+            if message.payload_length > cls._MAX_TABLE_BINARY_LENGTH:
+                original_payload += " ..."
+        else:
+            original_payload = message.payload[
+                0:cls._MAX_TABLE_PAYLOAD_LENGTH].decode("utf-8", "replace")
+            if message.payload_length > cls._MAX_TABLE_PAYLOAD_LENGTH:
+                original_payload += " ..."
+
+        message_type = "Event" if message.message_type == Message.MESSAGE_TYPE_EVENT \
+            else "Response" if message.message_type == Message.MESSAGE_TYPE_RESPONSE \
+            else "Request" if message.message_type == Message.MESSAGE_TYPE_REQUEST \
+            else "Error Response" if message.message_type == Message.MESSAGE_TYPE_ERROR \
+            else "Unknown"
+
+        message_entry = {
+            'topic': message.topic,
+            'received': int(round(message.received_time * 1000)),
+            'id': message.message_id,
+            'type': message_type,
+            'latency': message.latency if message.latency is not None else '',
+            'originalPayload': cls.escape(original_payload),
+            'sourceBroker': message.source_broker_id,
+            'sourceClient': message.source_client_id
+        }
+        return message_entry
+
+    @classmethod
+    def store_pending_messages(cls, module, client_id):
+        """
+        Moves the messages pending for the given client into its message
+        store
+
+        :param module: The monitor module
+        :param client_id: The client identifier
+        :return: A tuple containing the list of entries for the messages that
+            were stored and the number of pending messages that were dropped
+        """
+        messages = module.drain_messages(client_id)
+        if not messages:
+            return [], messages.dropped_count if messages is not None else 0
+
+        store = module.get_message_store(client_id)
+        entries = []
+        for message in messages:
+            entry = cls.create_message_entry(message)
+            store.add(entry, message)
+            entries.append(entry)
+        return entries, messages.dropped_count
+
+    def _get_row_argument(self, name, default):
+        """
+        Returns the value of the specified row index query argument
+
+        :param name: The name of the argument
+        :param default: The value to return if the argument is not present
+        :return: The row index
+        :raise ValueError: If the argument is not a non-negative integer
+        """
+        value = self.get_query_argument(name, None)
+        if value is None:
+            return default
+        try:
+            row = int(value)
+        except ValueError:
+            row = -1
+        if row < 0:
+            raise ValueError("Invalid " + name + ": " + value)
+        return row
+
     @tornado.web.authenticated
     def get(self, *args, **kwargs):
         """HTTP GET"""
@@ -60,72 +157,35 @@ class MessagesHandler(BaseRequestHandler):
                 "No client ID sent with request."))
             return
 
+        try:
+            start_row = self._get_row_argument("_startRow", 0)
+            end_row = self._get_row_argument("_endRow", None)
+        except ValueError as ex:
+            self.write(self._module.create_smartclient_error_response(str(ex)))
+            return
+
+        _, dropped_count = self.store_pending_messages(self._module, client_id)
+
+        criteria = {}
+        for field in self._CRITERIA_FIELDS:
+            values = self.get_query_arguments(field)
+            if values:
+                criteria[field] = values
+
+        total_rows, entries = self._module.get_message_store(client_id).query(
+            start_row, end_row, self.get_query_arguments("_sortBy"), criteria)
+
         response_wrapper = self._module.create_smartclient_response_wrapper()
 
         response = response_wrapper["response"]
 
-        messages = self._module.get_messages(client_id)
-
-        if messages:
-            for message in messages:
-                # If we have a topic stored as a response for this message ID
-                # use it instead of the response topic
-                topic = self._module.get_message_topic(message)
-                if message.message_type == Message.MESSAGE_TYPE_ERROR:
-                    payload = self.escape(message.error_message + " (" + str(
-                        message.error_code) + ")")
-                    original_payload = payload
-                else:
-                    decoded_payload = MessageUtils.decode_payload(message)
-                    original_payload = decoded_payload
-                    try:
-                        payload = "<pre><code>" + \
-                                  self.escape(
-                                      MessageUtils.dict_to_json(
-                                          MessageUtils.json_payload_to_dict(
-                                              message), True)) \
-                                  + "</pre></code>"
-                    except Exception:
-                        try:
-                            xml_payload = BeautifulSoup(original_payload,
-                                                        "html.parser")
-                            payload = "<pre lang='xml'><code>" + self.escape(
-                                xml_payload.prettify()) + "</code></pre>"
-                            original_payload = self.escape(original_payload)
-                        except Exception as ex:
-                            logger.exception(ex)
-                            payload = original_payload
-                    if len(payload) > self._MAX_DETAILS_PAYLOAD_LENGTH:
-                        payload = payload[0:self._MAX_DETAILS_PAYLOAD_LENGTH] + \
-                                  " ..."
-                    if len(payload) > self._MAX_TABLE_PAYLOAD_LENGTH:
-                        original_payload = \
-                            original_payload[0:self._MAX_TABLE_PAYLOAD_LENGTH] + \
-                            " ..."
-
-                message_type = "Event" if message.message_type == Message.MESSAGE_TYPE_EVENT \
-                    else "Response" if message.message_type == Message.MESSAGE_TYPE_RESPONSE \
-                    else "Request" if message.message_type == Message.MESSAGE_TYPE_REQUEST \
-                    else "Error Response" if message.message_type == Message.MESSAGE_TYPE_ERROR \
-                    else "Unknown"
-
-                message_entry = {
-                    'topic': topic,
-                    'received': '',
-                    'id': message.message_id,
-                    'type': message_type,
-                    'payload': payload,
-                    'originalPayload': original_payload,
-                    'sourceBroker': message.source_broker_id,
-                    'sourceClient': message.source_client_id,
-                    'otherFields': "<pre><code>" +
-                                   self.escape(MessageUtils.dict_to_json(
-                                       message.other_fields, True)) +
-                                   "</pre></code>"
-                }
-                response["data"].append(message_entry)
-
-        self._module.clear_messages(client_id)
+        # Let the UI know how many messages were dropped due to a full queue
+        response["droppedMessages"] = dropped_count
+
+        response["data"] = entries
+        response["startRow"] = start_row
+        response["endRow"] = start_row + len(entries)
+        response["totalRows"] = total_rows
 
         logger.debug(
             "Message handler response: %s", json.dumps(response_wrapper))
@@ -1,23 +1,24 @@
 from __future__ import absolute_import
+import heapq
 import logging
 import threading
 
-import time
-import datetime
 import pkg_resources
 
-from dxlclient.client import DxlClient
 from dxlclient.client_config import DxlClientConfig
-from dxlclient.callbacks import EventCallback
-from dxlclient.message import Request, Message
-from dxlbootstrap.util import MessageUtils
 from dxlconsole.module import Module
+from ..._compat import monotonic
 
 from .services_handler import ServiceUpdateHandler
 from .subscriptions_handler import SubscriptionsHandler
 from .messages_handler import MessagesHandler
 from .send_message_handler import SendMessageHandler
 from .websocket_handler import ConsoleWebSocketHandler
+from .message_detail_handler import MessageDetailHandler
+from .session import MonitorSession, SessionIndex
+from .lru_cache import LruCache
+from .service_monitor import ServiceMonitor
+from .client_multiplexer import DxlClientMultiplexer
 
 
 # Configure local logger
@@ -25,67 +26,124 @@ logger = logging.getLogger(__name__)
 
 
 class MonitorModule(Module):
-    # Request topic for service registry queries
-    SERVICE_REGISTRY_QUERY_TOPIC = '/mcafee/service/dxl/svcregistry/query'
+    # How long to retain clients without any keep alive before evicting them
+    CLIENT_RETENTION_MINUTES = 30
 
-    # Event topics for service registry changes
-    SERVICE_REGISTRY_REGISTER_EVENT_TOPIC = '/mcafee/event/dxl/svcregistry/register'
-    SERVICE_REGISTRY_UNREGISTER_EVENT_TOPIC = '/mcafee/event/dxl/svcregistry/unregister'
+    # The number of shards (each with its own lock) of the session index
+    SESSION_INDEX_SHARD_COUNT = 16
 
-    # How often(in seconds) to refresh the service list
-    SERVICE_UPDATE_INTERVAL = 60
+    # The default maximum number of messages queued for each "session"
+    DEFAULT_MESSAGE_QUEUE_SIZE = 1000
 
-    # How long to retain clients without any keep alive before evicting them
-    CLIENT_RETENTION_MINUTES = 30
+    # The default maximum number of captured messages retained for each
+    # "session" (paged through by the messages grid)
+    DEFAULT_MESSAGE_STORE_SIZE = 10000
+
+    # The maximum number of rendered message details cached (the messages
+    # themselves are retained by the message store of each "session")
+    MESSAGE_DETAIL_CACHE_SIZE = 1000
+
+    # The maximum number of sent requests tracked for response correlation
+    # (routing responses to the sessions that sent the requests)
+    REQUEST_TRACKER_SIZE = 10000
+
+    # How long (in seconds) to track a sent request awaiting its response
+    REQUEST_TRACKER_TTL = 300
+
+    # The default delay (in milliseconds) before notifying a web socket of
+    # pending messages (0 coalesces within a single IOLoop iteration)
+    DEFAULT_MESSAGE_NOTIFICATION_DELAY = 0
+
+    #: The name of the "Monitor" section within the application configuration file
+    MONITOR_CONFIG_SECTION = "Monitor"
+    #: The maximum number of messages queued for each "session"
+    MONITOR_MESSAGE_QUEUE_SIZE_PROP = "messageQueueSize"
+    #: The maximum number of captured messages retained for each "session"
+    MONITOR_MESSAGE_STORE_SIZE_PROP = "messageStoreSize"
+    #: The delay (in milliseconds) used to coalesce pending message notifications
+    MONITOR_MESSAGE_NOTIFICATION_DELAY_PROP = "messageNotificationDelay"
 
     # A default SmartClient JSON response to show no results
     NO_RESULT_JSON = u"""{response:{status:0,startRow:0,endRow:0,totalRows:0,data:[]}}"""
 
-    # Locks for the different dictionaries shared between Monitor Handlers
-    _service_dict_lock = threading.Lock()
-    _client_dict_lock = threading.Lock()
-    _web_socket_dict_lock = threading.Lock()
-    _pending_messages_lock = threading.Lock()
-
     def __init__(self, app):
         super(MonitorModule, self).__init__(
             app, "monitor", "Fabric Monitor", "/public/images/monitor.png",
             "monitor_layout")
 
-        # dictionary to store DXL Client instances unique to each "session"
-        self._client_dict = {}
-
-        # dictionary to store web sockets for each "session"
-        self._web_socket_dict = {}
-
-        # dictionary to store incoming messages for each "session"
-        self._pending_messages = {}
-
-        # dictionary to cache service state
-        self._services = {}
-
-        self._message_id_topics = {}
+        # the state (DXL client, pending and captured messages, web socket) of
+        # each "session"
+        self._sessions = SessionIndex(self.SESSION_INDEX_SHARD_COUNT)
+
+        # min-heap of (expiry deadline, client_id). The deadline of the live
+        # heap entry for each session is stored on the session (older entries
+        # are stale and ignored). Keep-alives only update the session, a
+        # session that has sent a keep-alive is rescheduled when its deadline
+        # is reached.
+        self._session_expiry_heap = []
+        self._session_expiry_condition = threading.Condition(threading.Lock())
+
+        # counts of evicted DXL clients and those that could not be released,
+        # logged upon each eviction
+        self._evicted_client_count = 0
+        self._leaked_client_count = 0
+        self._eviction_count_lock = threading.Lock()
+
+        # cache of rendered message details by message id
+        self._message_details = LruCache(self.MESSAGE_DETAIL_CACHE_SIZE)
+
+        self._message_queue_size = self.DEFAULT_MESSAGE_QUEUE_SIZE
+
+        # Message queue size
+        try:
+            self._message_queue_size = self.app.bootstrap_app.config.getint(
+                self.MONITOR_CONFIG_SECTION,
+                self.MONITOR_MESSAGE_QUEUE_SIZE_PROP)
+        except Exception:
+            pass
+        if self._message_queue_size < 1:
+            raise Exception("Invalid message queue size in configuration file: {0}"
+                            .format(self._message_queue_size))
+
+        self._message_store_size = self.DEFAULT_MESSAGE_STORE_SIZE
+
+        # Message store size
+        try:
+            self._message_store_size = self.app.bootstrap_app.config.getint(
+                self.MONITOR_CONFIG_SECTION,
+                self.MONITOR_MESSAGE_STORE_SIZE_PROP)
+        except Exception:
+            pass
+        if self._message_store_size < 1:
+            raise Exception("Invalid message store size in configuration file: {0}"
+                            .format(self._message_store_size))
+
+        self._message_notification_delay = self.DEFAULT_MESSAGE_NOTIFICATION_DELAY
+
+        # Message notification delay
+        try:
+            self._message_notification_delay = self.app.bootstrap_app.config.getint(
+                self.MONITOR_CONFIG_SECTION,
+                self.MONITOR_MESSAGE_NOTIFICATION_DELAY_PROP)
+        except Exception:
+            pass
+        if self._message_notification_delay < 0:
+            raise Exception("Invalid message notification delay in configuration file: {0}"
+                            .format(self._message_notification_delay))
 
         self._client_config = DxlClientConfig.create_dxl_config_from_file(
             self.app.bootstrap_app.client_config_path)
 
-        # DXL Client to perform operations that are the same for all users(svc registry queries)
-        self._dxl_service_client = DxlClient(self._client_config)
-        self._dxl_service_client.connect()
+        # the services registered with the fabric, pushed to the web sockets
+        self._service_monitor = ServiceMonitor(
+            self, self._client_config, self._sessions)
+        self._service_monitor.start()
 
-        self._dxl_service_client.add_event_callback(
-            MonitorModule.SERVICE_REGISTRY_REGISTER_EVENT_TOPIC,
-            _ServiceEventCallback(self))
-        self._dxl_service_client.add_event_callback(
-            MonitorModule.SERVICE_REGISTRY_UNREGISTER_EVENT_TOPIC,
-            _ServiceEventCallback(self))
-
-        self._refresh_all_services()
-
-        self._service_updater_thread = threading.Thread(
-            target=self._service_updater)
-        self._service_updater_thread.daemon = True
-        self._service_updater_thread.start()
+        # DXL Client shared by all "sessions" for subscriptions and messages
+        self._client_multiplexer = DxlClientMultiplexer(
+            self._client_config, self.REQUEST_TRACKER_SIZE,
+            self.REQUEST_TRACKER_TTL)
+        self._client_multiplexer.connect()
 
         self._dxl_client_cleanup_thread = threading.Thread(
             target=self._cleanup_dxl_clients)
@@ -98,6 +156,7 @@ class MonitorModule(Module):
             (r'/update_services', ServiceUpdateHandler, dict(module=self)),
             (r'/subscriptions', SubscriptionsHandler, dict(module=self)),
             (r'/messages', MessagesHandler, dict(module=self)),
+            (r'/message_detail', MessageDetailHandler, dict(module=self)),
             (r'/send_message', SendMessageHandler, dict(module=self)),
             (r'/websocket', ConsoleWebSocketHandler, dict(module=self))
         ]
@@ -109,13 +168,34 @@ class MonitorModule(Module):
         return content.replace("@PORT@", str(self.app.bootstrap_app.port))
 
     @property
-    def services(self):
-        with self._service_dict_lock:
-            return self._services.copy()
+    def service_monitor(self):
+        """
+        Returns the monitor of the services registered with the fabric
+
+        :return: The :class:`ServiceMonitor`
+        """
+        return self._service_monitor
 
     @property
-    def message_id_topics(self):
-        return self._message_id_topics
+    def message_notification_delay(self):
+        """
+        Returns the delay (in seconds) used to coalesce pending message
+        notifications sent to web sockets
+
+        :return: The delay (in seconds) used to coalesce pending message
+            notifications
+        """
+        return self._message_notification_delay / 1000.0
+
+    @property
+    def message_details(self):
+        """
+        Returns the cache of recently rendered message details keyed by
+        message identifier
+
+        :return: The :class:`LruCache` of message details
+        """
+        return self._message_details
 
     @property
     def client_config(self):
@@ -124,46 +204,64 @@ class MonitorModule(Module):
 
     def get_dxl_client(self, client_id):
         """
-        Retrieves the DxlClient for the given request. If there is not one associated with
-        the incoming request it creates a new one and saves the generated client_id as a cookie
+        Retrieves the DXL client for the given request. If there is not one associated with
+        the incoming request a new one is created for the client_id.
+
+        The returned client is a :class:`SessionClient` bound to the "session", all
+        sessions share a single connection to the DXL fabric. This method does not
+        block, see :meth:`connect_dxl_client`.
 
         :param client_id: The client identifier
-        :return: the DxlClient specific to this "session"
+        :return: the DXL client specific to this "session"
         """
-        if not self._client_exists_for_connection(client_id):
-            self._create_client_for_connection(client_id)
-
-        with self._client_dict_lock:
-            client = self._client_dict[client_id][0]
-
-        if not client.connected:
-            client.connect()
+        client = self._get_session(client_id).client
 
         logger.debug("Returning DXL client for id: %s", client_id)
         return client
 
-    def _create_client_for_connection(self, client_id):
+    def connect_dxl_client(self):
+        """
+        Connects the DXL client shared by the sessions to the fabric if it is not
+        connected. As this may block, it must not be invoked on the IOLoop thread.
+        """
+        self._client_multiplexer.connect()
+
+    def _get_session(self, client_id):
         """
-        Creates a DxlClient and stores it for the give client_id
+        Retrieves the session state for the given client_id, creating it (and
+        its session-bound DXL client) if necessary
 
-        :param client_id: the client_id for the DxlClient
+        :param client_id: the client_id for the session
+        :return: the :class:`MonitorSession` for the client_id
         """
-        client = DxlClient(self.client_config)
-        client.connect()
-        logger.info(
-            "Initializing new dxl client for client_id: %s", client_id)
-        with self._client_dict_lock:
-            self._client_dict[client_id] = (client, datetime.datetime.now())
+        session = self._sessions.get(client_id)
+        if session is not None:
+            return session
 
-    def _client_exists_for_connection(self, client_id):
+        new_session = MonitorSession(
+            client_id, self._client_multiplexer.session_client(client_id),
+            self._message_queue_size, self._message_store_size)
+        session = self._sessions.setdefault(client_id, new_session)
+        if session is new_session:
+            logger.info(
+                "Initializing new dxl client for client_id: %s", client_id)
+            with self._session_expiry_condition:
+                self._schedule_session_expiry(
+                    session, monotonic() + self.CLIENT_RETENTION_MINUTES * 60)
+                # Wake the cleanup thread in case this deadline is now the earliest
+                self._session_expiry_condition.notify()
+        return session
+
+    def _schedule_session_expiry(self, session, deadline):
         """
-        Checks if there is already an existing DxlClient for the given client_id.
+        Schedules the expiry check for the given session. The caller must
+        hold the session expiry lock.
 
-        :param client_id: the ID of the DxlClient to check for
-        :return: whether there is an existing DxlClient for this ID
+        :param session: the :class:`MonitorSession`
+        :param deadline: the (monotonic) time at which to check for expiry
         """
-        with self._client_dict_lock:
-            return client_id in self._client_dict
+        session.expiry_deadline = deadline
+        heapq.heappush(self._session_expiry_heap, (deadline, session.session_id))
 
     @staticmethod
     def create_smartclient_response_wrapper():
@@ -192,121 +290,140 @@ class MonitorModule(Module):
         response = response_wrapper["response"]
         response["status"] = -1
         response["data"] = error_message
-        return response
+        return response_wrapper
 
     def queue_message(self, message, client_id):
         """
         Adds the given message to the pending messages queue for the give client.
+        If the queue is full, the oldest pending message is dropped.
 
-        :param message: the message to enqueue
+        Messages for a client that no longer has a session (it was evicted)
+        are discarded.
+
+        :param message: the :class:`MessageRecord` to enqueue
         :param client_id: the client the message is intended for
         """
-        with self._pending_messages_lock:
-            if client_id not in self._pending_messages:
-                self._pending_messages[client_id] = []
+        session = self._sessions.get(client_id)
+        if session is None:
+            return
 
-            self._pending_messages[client_id].append(message)
+        session.queue_message(message)
 
-    def get_messages(self, client_id):
+    def drain_messages(self, client_id):
         """
-        Retrieves the messages pending for the given client. This does not
-        clear the queue after retrieving.
+        Atomically retrieves and clears the messages pending for the given
+        client. A fresh queue is swapped in under the lock so that messages
+        arriving while the returned queue is being processed are retained
+        for the next drain.
 
         :param client_id: the client to retrieve messages for
-        :return: a List of messages for the client
+        :return: a :class:`MessageQueue` of messages for the client or
+            ``None`` if there is no session for the client
         """
-        with self._pending_messages_lock:
-            if client_id in self._pending_messages:
-                return self._pending_messages[client_id]
-        return None
+        session = self._sessions.get(client_id)
+        return session.drain_messages() if session is not None else None
 
-    def clear_messages(self, client_id):
+    def get_message_store(self, client_id):
         """
-        Clears the pending messages for the given client.
+        Retrieves the store of captured messages for the given client
 
-        :param client_id: the client to clear messages for
+        :param client_id: the client to retrieve the message store for
+        :return: the :class:`MessageStore` for the client
         """
-        with self._pending_messages_lock:
-            self._pending_messages[client_id] = []
+        return self._get_session(client_id).message_store
 
-    def _service_updater(self):
-        """
-        A thread target that will run forever and do a complete refresh of the
-        service list on an interval or if the DXL client reconnects
+    def get_message_record(self, client_id, message_id):
         """
-        while True:
-            with self._dxl_service_client._connected_lock:
-                self._dxl_service_client._connected_wait_condition.wait(
-                    self.SERVICE_UPDATE_INTERVAL)
+        Retrieves the record of a message captured for the given client
 
-            if self._dxl_service_client.connected:
-                logger.debug("Refreshing service list.")
-                self._refresh_all_services()
+        :param client_id: the client the message was captured for
+        :param message_id: the message identifier
+        :return: the :class:`MessageRecord` for the message or ``None`` if
+            the message is no longer in the client's message store
+        """
+        session = self._sessions.get(client_id)
+        return session.message_store.get_record(message_id) \
+            if session is not None else None
 
     def _cleanup_dxl_clients(self):
         """
         A thread target that will run forever and evict DXL clients if their
-        clients have not sent a keep-alive
+        clients have not sent a keep-alive. The thread sleeps until the
+        earliest expiry deadline rather than polling.
         """
         logger.debug("DXL client cleanup thread initialized.")
         while True:
-            with self._client_dict_lock:
-                for key in list(self._client_dict):
-                    if self._client_dict[key][1] < \
-                            (datetime.datetime.now() - datetime.timedelta(
-                                    minutes=self.CLIENT_RETENTION_MINUTES)):
-                        logger.debug(
-                            "Evicting DXL client for client_id: %s", key)
-                        del self._client_dict[key]
-
-            time.sleep(5)
-
-    def _refresh_all_services(self):
-        """
-        Queries the broker for the service list and replaces the currently stored one with the new
-        results. Notifies all connected web sockets that new services are available.
-        """
-        req = Request(MonitorModule.SERVICE_REGISTRY_QUERY_TOPIC)
-
-        req.payload = "{}"
-        # Send the request
-        dxl_response = self._dxl_service_client.sync_request(req, 5)
-        dxl_response_dict = MessageUtils.json_payload_to_dict(dxl_response)
-        logger.info("Service registry response: %s", dxl_response_dict)
-
-        with self._service_dict_lock:
-            self._services = {}
-            for service_guid in dxl_response_dict["services"]:
-                self._services[service_guid] = dxl_response_dict["services"][
-                    service_guid]
-
-        self.notify_web_sockets()
-
-    def update_service(self, service_event):
-        """
-        Replaces a stored service data withe the one from the provided DXL service event
-
-        :param service_event: the  DXL service event containing the service
-        """
-        with self._service_dict_lock:
-            self._services[service_event['serviceGuid']] = service_event
-
-    def remove_service(self, service_event):
-        """
-        Removes a stored service using the provided DXL service event
-
-        :param service_event: the DXL service event containing the service to be removed
-        """
-        with self._service_dict_lock:
-            if service_event['serviceGuid'] in self._services:
-                del self._services[service_event['serviceGuid']]
+            with self._session_expiry_condition:
+                evicted = self._pop_expired_sessions()
+                while not evicted:
+                    timeout = self._session_expiry_heap[0][0] - monotonic() \
+                        if self._session_expiry_heap else None
+                    self._session_expiry_condition.wait(timeout)
+                    evicted = self._pop_expired_sessions()
+
+            # Release outside of the lock, unsubscribing waits on the broker
+            for session in evicted:
+                self._evict_session(session)
+
+    def _pop_expired_sessions(self):
+        """
+        Removes the sessions whose expiry deadline has passed without a
+        keep-alive, rescheduling those that have sent one. The caller must
+        hold the session expiry lock.
+
+        :return: A list of the expired :class:`MonitorSession` objects
+        """
+        expired = []
+        now = monotonic()
+        retention = self.CLIENT_RETENTION_MINUTES * 60
+        while self._session_expiry_heap and self._session_expiry_heap[0][0] <= now:
+            deadline, key = heapq.heappop(self._session_expiry_heap)
+            session = self._sessions.get(key)
+            if session is None or session.expiry_deadline != deadline:
+                # Stale entry for a session that has since been rescheduled
+                continue
+            keep_alive_deadline = session.last_keep_alive + retention
+            if keep_alive_deadline > now:
+                self._schedule_session_expiry(session, keep_alive_deadline)
+            else:
+                self._sessions.pop(key)
+                expired.append(session)
+        return expired
+
+    def _evict_session(self, session):
+        """
+        Releases the DXL client, pending messages and web socket for an evicted
+        "session"
+
+        :param session: The :class:`MonitorSession`
+        """
+        client_id = session.session_id
+        logger.debug("Evicting DXL client for client_id: %s", client_id)
+        try:
+            released = session.client.release()
+        except Exception as ex:
+            logger.error("Error releasing DXL client for client_id %s: %s",
+                         client_id, ex)
+            released = False
+
+        web_socket = session.close()
+        if web_socket:
+            self.io_loop.add_callback(web_socket.close)
+
+        with self._eviction_count_lock:
+            self._evicted_client_count += 1
+            if not released:
+                self._leaked_client_count += 1
+            evicted_count = self._evicted_client_count
+            leaked_count = self._leaked_client_count
+        logger.info("Evicted DXL client for client_id %s (%d evicted, %d not "
+                    "released)", client_id, evicted_count, leaked_count)
 
     def client_keep_alive(self, client_id):
         logger.debug("Client keep-alive received for client id: %s", client_id)
-        if self._client_exists_for_connection(client_id):
-            with self._client_dict_lock:
-                self._client_dict[client_id] = (self._client_dict[client_id][0],
-                                                datetime.datetime.now())
+        session = self._sessions.get(client_id)
+        if session is not None:
+            session.keep_alive()
 
     @property
     def io_loop(self):
@@ -325,70 +442,17 @@ class MonitorModule(Module):
         :param web_socket:  the web socket to store
         """
         logger.debug("Adding web socket for client: %s", client_id)
-        with self._web_socket_dict_lock:
-            self._web_socket_dict[client_id] = web_socket
+        self._get_session(client_id).set_web_socket(web_socket)
 
-    def remove_web_socket(self, client_id):
+    def remove_web_socket(self, client_id, web_socket):
         """
-        Removes any web socket associated with the given client_id
+        Removes the given web socket associated with the given client_id,
+        unless it has since been replaced by another web socket
 
         :param client_id: The client ID
+        :param web_socket: The web socket to remove
         """
         logger.debug("Removing web socket for client: %s", client_id)
-        with self._web_socket_dict_lock:
-            self._web_socket_dict.pop(client_id, None)
-
-    def notify_web_sockets(self):
-        """
-        Notifies all web sockets that there are pending service updates
-        """
-        with self._web_socket_dict_lock:
-            for key in self._web_socket_dict:
-                try:
-                    self.io_loop.add_callback(
-                        self._web_socket_dict[key].write_message,
-                        u"serviceUpdates")
-                except Exception:
-                    pass
-
-    def get_message_topic(self, message):
-        """
-        Determines the topic for the provided message. Replaces the response channel in
-        responses with the topic of the original request
-
-        :param message: The DXL message
-        :return:  The topic to use
-        """
-        if (message.message_type == Message.MESSAGE_TYPE_RESPONSE or
-                message.message_type == Message.MESSAGE_TYPE_ERROR) and \
-                message.request_message_id in self.message_id_topics:
-            topic = self.message_id_topics[message.request_message_id]
-            del self.message_id_topics[message.request_message_id]
-        else:
-            topic = message.destination_topic
-        return topic
-
-
-class _ServiceEventCallback(EventCallback):
-    """
-    A DXL event callback to handle service change events(register and unregister)
-    """
-
-    def __init__(self, module):
-        super(_ServiceEventCallback, self).__init__()
-        self._module = module
-
-    def on_event(self, event):
-        """
-        Notifies all clients that there are changes to the service registry
-
-        :param event: the incoming event
-        """
-        service_event = MessageUtils.json_payload_to_dict(event)
-        logger.info("Received service registry event: %s", service_event)
-        if event.destination_topic == MonitorModule.SERVICE_REGISTRY_REGISTER_EVENT_TOPIC:
-            self._module.update_service(service_event)
-        elif event.destination_topic == MonitorModule.SERVICE_REGISTRY_UNREGISTER_EVENT_TOPIC:
-            self._module.remove_service(service_event)
-
-        self._module.notify_web_sockets()
+        session = self._sessions.get(client_id)
+        if session is not None:
+            session.remove_web_socket(web_socket)
@@ -0,0 +1,154 @@
+from __future__ import absolute_import
+import codecs
+import re
+
+
+class PayloadFormatter(object):
+    """
+    Utility methods for classifying and formatting DXL message payloads for
+    display
+    """
+
+    #: A JSON payload
+    PAYLOAD_TYPE_JSON = "json"
+    #: An XML (or other markup) payload
+    PAYLOAD_TYPE_XML = "xml"
+    #: A textual payload
+    PAYLOAD_TYPE_TEXT = "text"
+    #: A binary payload
+    PAYLOAD_TYPE_BINARY = "binary"
+
+    # The number of leading bytes examined to classify a payload
+    _SNIFF_LENGTH = 512
+
+    # The maximum fraction of control characters in a textual payload
+    _MAX_CONTROL_CHARACTER_RATIO = 0.1
+
+    # The number of bytes displayed on each line of a hex dump
+    _HEX_DUMP_LINE_LENGTH = 16
+
+    # Control characters that are expected in textual payloads
+    _TEXT_CONTROL_CHARACTERS = u"\t\n\r\f\b"
+
+    # The string used to indent each nesting level of formatted XML
+    _XML_INDENT = " "
+
+    # Tokens of an XML document: comments, CDATA sections, processing
+    # instructions/declarations/tags and character data
+    _XML_TOKEN_PATTERN = re.compile(
+        r"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<[^>]*>?|[^<]+", re.DOTALL)
+
+    @staticmethod
+    def sniff_payload_type(payload):
+        """
+        Classifies the specified payload as JSON, XML, text or binary by
+        examining its leading bytes. The classification is a fast heuristic,
+        a payload classified as JSON or XML is not guaranteed to be well-formed.
+
+        :param payload: The payload (bytes)
+        :return: The payload type (one of the ``PAYLOAD_TYPE_`` constants)
+        """
+        sample = payload[0:PayloadFormatter._SNIFF_LENGTH]
+        if b"\x00" in sample:
+            return PayloadFormatter.PAYLOAD_TYPE_BINARY
+
+        try:
+            # An incremental decoder tolerates a multi-byte character that is
+            # split at the end of the sample
+            text = codecs.getincrementaldecoder("utf-8")().decode(sample)
+        except UnicodeDecodeError:
+            return PayloadFormatter.PAYLOAD_TYPE_BINARY
+
+        control_count = 0
+        for char in text:
+            if char < u" " and char not in PayloadFormatter._TEXT_CONTROL_CHARACTERS:
+                control_count += 1
+        if control_count > len(text) * PayloadFormatter._MAX_CONTROL_CHARACTER_RATIO:
+            return PayloadFormatter.PAYLOAD_TYPE_BINARY
+
+        text = text.lstrip(u"\ufeff \t\r\n")
+        if text.startswith(u"{") or text.startswith(u"["):
+            return PayloadFormatter.PAYLOAD_TYPE_JSON
+        if text.startswith(u"<"):
+            return PayloadFormatter.PAYLOAD_TYPE_XML
+        return PayloadFormatter.PAYLOAD_TYPE_TEXT
+
+    @staticmethod
+    def hex_dump(payload, max_bytes):
+        """
+        Formats the leading bytes of the specified payload as a hex dump, one
+        line of offset, hex bytes and printable characters per 16 bytes.
+
+        :param payload: The payload (bytes)
+        :param max_bytes: The maximum number of bytes to include in the dump
+        :return: The hex dump
+        """
+        data = bytearray(payload[0:max_bytes])
+        line_length = PayloadFormatter._HEX_DUMP_LINE_LENGTH
+        lines = []
+        for offset in range(0, len(data), line_length):
+            chunk = data[offset:offset + line_length]
+            hex_bytes = " ".join("{0:02x}".format(byte) for byte in chunk)
+            chars = "".join(chr(byte) if 32 <= byte < 127 else "." for byte in chunk)
+            lines.append("{0:08x}  {1:<{2}}  |{3}|".format(
+                offset, hex_bytes, line_length * 3 - 1, chars))
+        return "\n".join(lines)
+
+    @staticmethod
+    def hex_preview(payload, max_bytes):
+        """
+        Formats the leading bytes of the specified payload as a single line of
+        hex bytes
+
+        :param payload: The payload (bytes)
+        :param max_bytes: The maximum number of bytes to include in the preview
+        :return: The hex preview
+        """
+        return " ".join("{0:02x}".format(byte)
+                        for byte in bytearray(payload[0:max_bytes]))
+
+    @staticmethod
+    def prettify_xml(text, max_length):
+        """
+        Pretty prints the specified XML (or other markup) text by placing each
+        tag and text node on its own line, indented by nesting level.
+
+        The text is tokenized incrementally rather than parsed into a document
+        tree, and formatting stops once ``max_length`` characters have been
+        produced. Markup that is not well-formed is formatted on a best-effort
+        basis.
+
+        :param text: The XML text
+        :param max_length: The maximum length of the formatted text
+        :return: A tuple containing the formatted text and whether the
+            formatted text was truncated
+        """
+        lines = []
+        length = 0
+        depth = 0
+        for match in PayloadFormatter._XML_TOKEN_PATTERN.finditer(text):
+            token = match.group(0)
+            if token.startswith("<"):
+                if token.startswith("</"):
+                    depth = max(0, depth - 1)
+                    line_depth = depth
+                elif token.startswith("<!") or token.startswith("<?") or \
+                        token.endswith("/>") or not token.endswith(">"):
+                    line_depth = depth
+                else:
+                    line_depth = depth
+                    depth += 1
+            else:
+                token = token.strip()
+                if not token:
+                    continue
+                line_depth = depth
+
+            line = PayloadFormatter._XML_INDENT * line_depth + token
+            # Account for the newline separating this line from the previous
+            length += len(line) + (1 if lines else 0)
+            lines.append(line)
+            if length >= max_length:
+                return "\n".join(lines)[0:max_length], True
+
+        return "\n".join(lines), False
@@ -0,0 +1,114 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+import threading
+
+from ..._compat import monotonic
+
+
+class RequestTracker(object):
+    """
+    A thread-safe table that correlates the responses received by the console
+    with the requests it sent, recording the topic of each request, the
+    session that sent it (to route its response to) and the time it was sent
+    so that the round-trip latency can be reported.
+
+    Each entry has a deadline after which it is discarded, which bounds the
+    table when responses are never received. Entries are also discarded,
+    oldest first, if the table exceeds its capacity.
+    """
+
+    def __init__(self, capacity, ttl):
+        """
+        Constructor parameters:
+
+        :param capacity: The maximum number of requests tracked
+        :param ttl: The time (in seconds) a request is tracked for after it is
+            sent
+        """
+        if capacity < 1:
+            raise ValueError("Request tracker capacity must be at least 1")
+        self._capacity = capacity
+        self._ttl = ttl
+        # message id -> _TrackedRequest, in deadline order (the TTL is fixed)
+        self._requests = OrderedDict()
+        self._lock = threading.Lock()
+
+    def track(self, message_id, topic, session_id):
+        """
+        Starts tracking a request that is being sent
+
+        :param message_id: The message identifier of the request
+        :param topic: The topic the request is sent to
+        :param session_id: The identifier of the session sending the request
+        """
+        now = monotonic()
+        with self._lock:
+            self._expire(now)
+            self._requests.pop(message_id, None)
+            self._requests[message_id] = _TrackedRequest(
+                topic, session_id, now, now + self._ttl)
+            if len(self._requests) > self._capacity:
+                self._requests.popitem(last=False)
+
+    def pop(self, message_id):
+        """
+        Stops tracking a request upon the receipt of its response, returning
+        its topic, session and the round-trip latency of the response
+
+        :param message_id: The message identifier of the request
+        :return: A tuple containing the topic, session identifier and latency
+            (in milliseconds) of the request, or ``None`` if the request is not
+            tracked
+        """
+        now = monotonic()
+        with self._lock:
+            self._expire(now)
+            request = self._requests.pop(message_id, None)
+        if request is None:
+            return None
+        return request.topic, request.session_id, int(round((now - request.sent) * 1000))
+
+    def discard_session(self, session_id):
+        """
+        Stops tracking the requests sent by the given session (when it is
+        released)
+
+        :param session_id: The session identifier
+        """
+        with self._lock:
+            for message_id in [message_id for message_id, request
+                               in self._requests.items()
+                               if request.session_id == session_id]:
+                del self._requests[message_id]
+
+    def _expire(self, now):
+        """
+        Discards the requests whose deadline has passed. The caller must hold
+        the lock.
+
+        :param now: The current (monotonic) time
+        """
+        while self._requests:
+            message_id = next(iter(self._requests))
+            if self._requests[message_id].deadline > now:
+                break
+            del self._requests[message_id]
+
+    def __len__(self):
+        with self._lock:
+            self._expire(monotonic())
+            return len(self._requests)
+
+
+class _TrackedRequest(object):
+    """
+    A request tracked by a :class:`RequestTracker`
+    """
+
+    __slots__ = ("topic", "session_id", "sent", "deadline")
+
+    def __init__(self, topic, session_id, sent, deadline):
+        self.topic = topic
+        self.session_id = session_id
+        self.sent = sent
+        self.deadline = deadline
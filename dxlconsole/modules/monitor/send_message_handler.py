@@ -3,6 +3,7 @@ import traceback
 
 import logging
 import tornado
+from tornado import gen
 from dxlclient import Event, Request, json
 
 from dxlconsole.handlers import BaseRequestHandler
@@ -13,8 +14,14 @@ logger = logging.getLogger(__name__)
 class SendMessageHandler(BaseRequestHandler):
     """
     Handles post requests to send messages
+
+    Messages are sent on the console's executor, as sending blocks while the
+    client connects to the fabric.
     """
 
+    #: The time (in seconds) to wait for a message to be sent
+    SEND_TIMEOUT = 30
+
     def __init__(self, application, request, module):
         super(SendMessageHandler, self).__init__(application, request)
         self._module = module
@@ -23,6 +30,7 @@ class SendMessageHandler(BaseRequestHandler):
         pass
 
     @tornado.web.authenticated
+    @gen.coroutine
     def post(self, *args, **kwargs):
         try:
             request_params = json.loads(self.request.body.decode("utf8"))
@@ -52,26 +60,46 @@ class SendMessageHandler(BaseRequestHandler):
             logger.debug(
                 "Sending " + message_type + " on topic " + message_topic +
                 " with payload: " + message_payload)
-            message_id = None
             if message_type == 'Event':
-                event = Event(message_topic)
-                event.payload = message_payload
-                client.send_event(event)
-                message_id = event.message_id
+                message = Event(message_topic)
+                message.payload = message_payload
             elif message_type == 'Request':
-                req = Request(message_topic)
-                req.payload = message_payload
+                message = Request(message_topic)
+                message.payload = message_payload
                 if 'serviceId' in request_params:
                     if request_params['serviceId'] is not None and \
                             request_params['serviceId'] != "":
-                        req.service_id = request_params['serviceId']
-                self._module.message_id_topics[req.message_id] = message_topic
-                client.async_request(req)
-                message_id = req.message_id
+                        message.service_id = request_params['serviceId']
+            else:
+                raise Exception("Unknown message type: " + message_type)
+
+            yield self.run_blocking(self.SEND_TIMEOUT, self._send_message,
+                                    client, message)
+            message_id = message.message_id
 
             self.write("Message successfully sent.&nbsp;&nbsp;&nbsp;[ID : " + message_id + "]")
+        except gen.TimeoutError:
+            logger.error("Timed out sending message.")
+            self.write("Failed to send message: timed out waiting for the "
+                       "message to be sent.")
         except Exception as ex:
             logger.error("Exception while processing send message request. %s",
                          ex)
             logger.error(traceback.format_exc())
             self.write("Failed to send message: " + str(ex))
+
+    def _send_message(self, client, message):
+        """
+        Sends the specified message with the session-bound client, connecting
+        to the fabric first if necessary. This method blocks and is run on the
+        console's executor.
+
+        :param client: The session-bound DXL client
+        :param message: The :class:`dxlclient.message.Event` or
+            :class:`dxlclient.message.Request` to send
+        """
+        self._module.connect_dxl_client()
+        if isinstance(message, Request):
+            client.async_request(message)
+        else:
+            client.send_event(message)
@@ -0,0 +1,286 @@
+from __future__ import absolute_import
+import json
+import logging
+import threading
+import time
+
+from dxlclient.client import DxlClient
+from dxlclient.callbacks import EventCallback
+from dxlclient.message import Request
+from dxlbootstrap.util import MessageUtils
+from ..._compat import monotonic
+
+from .lru_cache import LruCache
+from .service_registry import ServiceRegistry
+from .services_handler import ServiceUpdateHandler
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+class ServiceMonitor(object):
+    """
+    Keeps the services registered with the fabric current for the monitor
+    module and pushes the changes to them to the web sockets of the
+    "sessions".
+
+    The services are queried from the service registry with a dedicated DXL
+    client (shared by all sessions) and updated from the registry's register
+    and unregister events. Services are expired locally once their TTL has
+    elapsed, a complete refresh of the services is only done when the DXL
+    client reconnects or to check for drift.
+    """
+
+    # Request topic for service registry queries
+    SERVICE_REGISTRY_QUERY_TOPIC = '/mcafee/service/dxl/svcregistry/query'
+
+    # Event topics for service registry changes
+    SERVICE_REGISTRY_REGISTER_EVENT_TOPIC = '/mcafee/event/dxl/svcregistry/register'
+    SERVICE_REGISTRY_UNREGISTER_EVENT_TOPIC = '/mcafee/event/dxl/svcregistry/unregister'
+
+    # How often (in seconds) to check the service list for drift from the
+    # service registry, by a full query
+    SERVICE_VERIFY_INTERVAL = 600
+
+    # How long (in seconds) to wait before retrying a failed service list query
+    SERVICE_RETRY_INTERVAL = 60
+
+    # How long (in seconds) to retain a service past the end of its TTL
+    SERVICE_EXPIRY_GRACE = 60
+
+    # The window (in seconds) over which service registry changes are
+    # coalesced before being pushed to the web sockets
+    SERVICE_DELTA_DELAY = 0.25
+
+    def __init__(self, module, client_config, sessions):
+        """
+        Constructor parameters:
+
+        :param module: The monitor module
+        :param client_config: The :class:`dxlclient.client_config.DxlClientConfig`
+            for the DXL client that queries the service registry
+        :param sessions: The :class:`SessionIndex` of the "sessions" whose web
+            sockets are notified of service changes
+        """
+        self._module = module
+        self._sessions = sessions
+
+        # versioned snapshots of the service state
+        self._service_registry = ServiceRegistry(self.SERVICE_EXPIRY_GRACE)
+
+        # the serialized /update_services response for the current version of
+        # the service state
+        self._response_cache = LruCache(1)
+
+        # the snapshot that the last service deltas pushed to the web sockets
+        # brought them up to, and whether a push is scheduled
+        self._pushed_snapshot = self._service_registry.snapshot
+        self._delta_lock = threading.Lock()
+        self._delta_pending = False
+
+        # DXL Client to perform operations that are the same for all users(svc registry queries)
+        self._dxl_service_client = DxlClient(client_config)
+
+        self._service_updater_thread = threading.Thread(
+            target=self._service_updater)
+        self._service_updater_thread.daemon = True
+
+    def start(self):
+        """
+        Connects the DXL client to the fabric, queries the service registry
+        for the current services and starts keeping them current
+        """
+        self._dxl_service_client.connect()
+
+        self._dxl_service_client.add_event_callback(
+            self.SERVICE_REGISTRY_REGISTER_EVENT_TOPIC,
+            _ServiceEventCallback(self))
+        self._dxl_service_client.add_event_callback(
+            self.SERVICE_REGISTRY_UNREGISTER_EVENT_TOPIC,
+            _ServiceEventCallback(self))
+
+        self._refresh_all_services()
+
+        self._service_updater_thread.start()
+
+    @property
+    def snapshot(self):
+        """
+        Returns the current versioned snapshot of the services registered
+        with the fabric
+
+        :return: The current :class:`ServicesSnapshot`
+        """
+        return self._service_registry.snapshot
+
+    @property
+    def response_cache(self):
+        """
+        Returns the cache of the serialized service listing response, keyed by
+        the version of the services snapshot it was rendered from
+
+        :return: The :class:`LruCache` of service listing responses
+        """
+        return self._response_cache
+
+    def update_service(self, service_event):
+        """
+        Replaces a stored service data withe the one from the provided DXL service event
+
+        :param service_event: the  DXL service event containing the service
+        :return: ``True`` if the stored services changed
+        """
+        return self._service_registry.update(service_event)
+
+    def remove_service(self, service_event):
+        """
+        Removes a stored service using the provided DXL service event
+
+        :param service_event: the DXL service event containing the service to be removed
+        :return: ``True`` if the stored services changed
+        """
+        return self._service_registry.remove(service_event['serviceGuid'])
+
+    def notify_web_sockets(self):
+        """
+        Schedules a push of the pending service registry changes to all web
+        sockets unless one is already scheduled. Changes are coalesced over
+        the service delta delay. This method is thread-safe.
+        """
+        with self._delta_lock:
+            if self._delta_pending:
+                return
+            self._delta_pending = True
+        io_loop = self._module.io_loop
+        io_loop.add_callback(io_loop.call_later, self.SERVICE_DELTA_DELAY,
+                             self._push_service_deltas)
+
+    def _refresh_all_services(self):
+        """
+        Queries the broker for the service list and replaces the currently stored one with the new
+        results. Notifies all connected web sockets if the service list changed.
+
+        :return: ``True`` if the service list changed
+        """
+        req = Request(self.SERVICE_REGISTRY_QUERY_TOPIC)
+
+        req.payload = "{}"
+        # Send the request
+        dxl_response = self._dxl_service_client.sync_request(req, 5)
+        dxl_response_dict = MessageUtils.json_payload_to_dict(dxl_response)
+        logger.debug("Service registry response: %s", dxl_response_dict)
+
+        if not self._service_registry.replace_all(dxl_response_dict["services"]):
+            return False
+        self.notify_web_sockets()
+        return True
+
+    def _service_updater(self):
+        """
+        A thread target that will run forever and keep the service list
+        current between registry events: services are expired locally once
+        their TTL has elapsed, and a complete refresh of the service list is
+        only done when the DXL client reconnects or to check for drift.
+        """
+        connected = self._dxl_service_client.connected
+        next_verify = monotonic() + self.SERVICE_VERIFY_INTERVAL
+        while True:
+            # While disconnected, the verification waits for the reconnect
+            timeout = max(0, next_verify - monotonic()) if connected else None
+            next_expiry = self._service_registry.next_expiry
+            if next_expiry is not None:
+                expiry_timeout = max(0, next_expiry - time.time())
+                timeout = expiry_timeout if timeout is None \
+                    else min(timeout, expiry_timeout)
+
+            with self._dxl_service_client._connected_lock:
+                self._dxl_service_client._connected_wait_condition.wait(timeout)
+
+            reconnected = not connected and self._dxl_service_client.connected
+            connected = self._dxl_service_client.connected
+
+            if connected and (reconnected or monotonic() >= next_verify):
+                logger.debug("Refreshing service list.")
+                try:
+                    if self._refresh_all_services() and not reconnected:
+                        logger.info("Service list drifted from the service "
+                                    "registry, resynchronized.")
+                    next_verify = monotonic() + self.SERVICE_VERIFY_INTERVAL
+                except Exception as ex:
+                    logger.error("Error refreshing service list: %s", ex)
+                    next_verify = monotonic() + self.SERVICE_RETRY_INTERVAL
+
+            if self._service_registry.expire(time.time()):
+                logger.debug("Expired services past their TTL.")
+                self.notify_web_sockets()
+
+    def _push_service_deltas(self):
+        """
+        Invoked on the IOLoop thread to push the changes to the service
+        registry since the last push to all web sockets, as a single
+        ``serviceDeltas`` JSON frame.
+
+        The frame contains the version of the services the changes apply to
+        (``fromVersion``) and the version they bring the services up to
+        (``toVersion``). A client whose services are not at ``fromVersion``
+        (it missed a frame) must resync by fetching the full service listing.
+        """
+        with self._delta_lock:
+            self._delta_pending = False
+
+        snapshot = self._service_registry.snapshot
+        previous = self._pushed_snapshot
+        if snapshot.version == previous.version:
+            return
+        self._pushed_snapshot = snapshot
+
+        deltas = []
+        for change, service_guid, service, previous_service in \
+                snapshot.changes_since(previous):
+            delta = {"op": change, "serviceGuid": service_guid}
+            if previous_service is not None:
+                # The tree entries of the service and its request topics
+                delta["removedIds"] = [service_guid] + [
+                    service_guid + request_topic for request_topic
+                    in previous_service["requestChannels"]]
+            if service is not None:
+                delta["data"] = \
+                    ServiceUpdateHandler.create_service_entries(service)
+            deltas.append(delta)
+        frame = json.dumps({"type": "serviceDeltas",
+                            "fromVersion": previous.version,
+                            "toVersion": snapshot.version,
+                            "deltas": deltas})
+        logger.debug("Pushing service deltas: %s", frame)
+
+        for session in self._sessions.values():
+            web_socket = session.web_socket
+            if web_socket is not None:
+                web_socket.notify_service_deltas(frame)
+
+
+class _ServiceEventCallback(EventCallback):
+    """
+    A DXL event callback to handle service change events(register and unregister)
+    """
+
+    def __init__(self, service_monitor):
+        super(_ServiceEventCallback, self).__init__()
+        self._service_monitor = service_monitor
+
+    def on_event(self, event):
+        """
+        Notifies all clients that there are changes to the service registry
+
+        :param event: the incoming event
+        """
+        service_event = MessageUtils.json_payload_to_dict(event)
+        logger.info("Received service registry event: %s", service_event)
+        changed = False
+        if event.destination_topic == ServiceMonitor.SERVICE_REGISTRY_REGISTER_EVENT_TOPIC:
+            changed = self._service_monitor.update_service(service_event)
+        elif event.destination_topic == ServiceMonitor.SERVICE_REGISTRY_UNREGISTER_EVENT_TOPIC:
+            changed = self._service_monitor.remove_service(service_event)
+
+        if changed:
+            self._service_monitor.notify_web_sockets()
@@ -0,0 +1,285 @@
+from __future__ import absolute_import
+import hashlib
+import heapq
+import json
+import threading
+import uuid
+
+
+def services_content_hash(services):
+    """
+    Returns a hash of the content of the specified services, independent of
+    the order of the services and of their properties
+
+    :param services: The dictionary of services keyed by service GUID
+    :return: The content hash (hex string)
+    """
+    return hashlib.sha1(
+        json.dumps(services, sort_keys=True).encode("utf8")).hexdigest()
+
+
+class ServicesSnapshot(object):
+    """
+    An immutable, versioned view of the services registered with the fabric.
+
+    The ``services`` dictionary (service GUID -> service) is shared by every
+    reader of the snapshot and must not be modified. A service that is not
+    changed by an update is carried over (by reference) to the next snapshot.
+    """
+
+    #: A service that was added
+    CHANGE_ADD = "add"
+    #: A service that was updated (re-registered with different properties)
+    CHANGE_UPDATE = "update"
+    #: A service that was removed
+    CHANGE_REMOVE = "remove"
+
+    __slots__ = ("_registry_id", "_version", "_services", "_content_hash")
+
+    def __init__(self, registry_id, version, services):
+        """
+        Constructor parameters:
+
+        :param registry_id: The identifier of the registry that created the
+            snapshot
+        :param version: The version of the snapshot
+        :param services: The dictionary of services keyed by service GUID
+        """
+        self._registry_id = registry_id
+        self._version = version
+        self._services = services
+        self._content_hash = None
+
+    @property
+    def registry_id(self):
+        """
+        Returns the identifier of the registry that created the snapshot. The
+        identifier and version together identify the snapshot across restarts.
+
+        :return: The identifier of the registry
+        """
+        return self._registry_id
+
+    @property
+    def version(self):
+        """
+        Returns the version of the snapshot, which is incremented whenever the
+        registered services change
+
+        :return: The version of the snapshot
+        """
+        return self._version
+
+    @property
+    def services(self):
+        """
+        Returns the services keyed by service GUID
+
+        :return: The dictionary of services (must not be modified)
+        """
+        return self._services
+
+    @property
+    def content_hash(self):
+        """
+        Returns the hash of the content of the services (computed on first use)
+
+        :return: The content hash (hex string), see :func:`services_content_hash`
+        """
+        if self._content_hash is None:
+            self._content_hash = services_content_hash(self._services)
+        return self._content_hash
+
+    def changes_since(self, previous):
+        """
+        Returns the changes to the services between the specified (older)
+        snapshot and this one
+
+        :param previous: The older :class:`ServicesSnapshot`
+        :return: A list of ``(change type, service GUID, service, previous
+            service)`` tuples, where the change type is one of the ``CHANGE_``
+            constants and the service (previous service) is ``None`` for a
+            removed (added) service
+        """
+        changes = []
+        previous_services = previous.services
+        for service_guid, service in self._services.items():
+            previous_service = previous_services.get(service_guid)
+            if previous_service is None:
+                changes.append(
+                    (self.CHANGE_ADD, service_guid, service, None))
+            elif previous_service is not service:
+                changes.append(
+                    (self.CHANGE_UPDATE, service_guid, service, previous_service))
+        for service_guid, previous_service in previous_services.items():
+            if service_guid not in self._services:
+                changes.append(
+                    (self.CHANGE_REMOVE, service_guid, None, previous_service))
+        return changes
+
+
+class ServiceRegistry(object):
+    """
+    A thread-safe store of the services registered with the fabric.
+
+    Readers retrieve the current :class:`ServicesSnapshot` without locking or
+    copying. Writers build a new snapshot (with the next version) only when a
+    change actually modifies the registered services.
+
+    Each service expires once its TTL (``ttlMins``) has elapsed since its
+    ``registrationTime`` (plus a grace period) without it re-registering, see
+    :meth:`expire`. Services without a registration time or TTL never expire.
+    """
+
+    def __init__(self, expiry_grace=0):
+        """
+        Constructor parameters:
+
+        :param expiry_grace: The time (in seconds) a service is retained past
+            the end of its TTL, allowing for re-registration delays and clock
+            skew between the broker and the console
+        """
+        self._lock = threading.Lock()
+        self._snapshot = ServicesSnapshot(uuid.uuid4().hex, 0, {})
+        self._expiry_grace = expiry_grace
+        # min-heap of (expiry time, service GUID). An entry is stale (and
+        # ignored) if the service has since been removed or re-registered.
+        self._expiry_heap = []
+
+    @property
+    def next_expiry(self):
+        """
+        Returns the earliest time at which a service may expire
+
+        :return: The earliest expiry time (seconds since the epoch) or
+            ``None`` if no service expires
+        """
+        with self._lock:
+            return self._expiry_heap[0][0] if self._expiry_heap else None
+
+    @property
+    def snapshot(self):
+        """
+        Returns the current snapshot of the registered services
+
+        :return: The current :class:`ServicesSnapshot`
+        """
+        return self._snapshot
+
+    def replace_all(self, services):
+        """
+        Replaces the registered services with those provided
+
+        :param services: The dictionary of services keyed by service GUID
+        :return: ``True`` if the registered services changed
+        """
+        with self._lock:
+            # Compare by content hash, a match means that the services have not
+            # drifted from those received in registration events
+            if services_content_hash(services) == self._snapshot.content_hash:
+                return False
+            current_services = self._snapshot.services
+            # Carry over the unchanged services so that they can be identified
+            # by reference
+            new_services = {}
+            for service_guid, service in services.items():
+                current_service = current_services.get(service_guid)
+                new_services[service_guid] = current_service \
+                    if current_service == service else service
+            self._expiry_heap = []
+            for service_guid, service in new_services.items():
+                self._schedule_expiry(service_guid, service)
+            self._publish(new_services)
+            return True
+
+    def update(self, service):
+        """
+        Adds or replaces the specified service
+
+        :param service: The service (dict) containing a ``serviceGuid``
+        :return: ``True`` if the registered services changed
+        """
+        with self._lock:
+            service_guid = service["serviceGuid"]
+            if self._snapshot.services.get(service_guid) == service:
+                return False
+            services = dict(self._snapshot.services)
+            services[service_guid] = service
+            self._schedule_expiry(service_guid, service)
+            self._publish(services)
+            return True
+
+    def remove(self, service_guid):
+        """
+        Removes the specified service
+
+        :param service_guid: The GUID of the service to remove
+        :return: ``True`` if the registered services changed
+        """
+        with self._lock:
+            if service_guid not in self._snapshot.services:
+                return False
+            services = dict(self._snapshot.services)
+            del services[service_guid]
+            self._publish(services)
+            return True
+
+    def expire(self, now):
+        """
+        Removes the services whose TTL has elapsed
+
+        :param now: The current time (seconds since the epoch)
+        :return: ``True`` if the registered services changed
+        """
+        with self._lock:
+            services = None
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expiry, service_guid = heapq.heappop(self._expiry_heap)
+                current_services = services if services is not None \
+                    else self._snapshot.services
+                service = current_services.get(service_guid)
+                if service is None or self._expiry_time(service) != expiry:
+                    continue
+                if services is None:
+                    services = dict(self._snapshot.services)
+                del services[service_guid]
+            if services is None:
+                return False
+            self._publish(services)
+            return True
+
+    def _expiry_time(self, service):
+        """
+        Returns the time at which the specified service expires
+
+        :param service: The service (dict)
+        :return: The expiry time (seconds since the epoch) or ``None`` if the
+            service does not expire
+        """
+        try:
+            return float(service["registrationTime"]) + \
+                float(service["ttlMins"]) * 60 + self._expiry_grace
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _schedule_expiry(self, service_guid, service):
+        """
+        Schedules the expiry of the specified service. The caller must hold
+        the lock.
+
+        :param service_guid: The GUID of the service
+        :param service: The service (dict)
+        """
+        expiry = self._expiry_time(service)
+        if expiry is not None:
+            heapq.heappush(self._expiry_heap, (expiry, service_guid))
+
+    def _publish(self, services):
+        """
+        Replaces the current snapshot with one for the specified services. The
+        caller must hold the lock.
+
+        :param services: The dictionary of services keyed by service GUID
+        """
+        self._snapshot = ServicesSnapshot(
+            self._snapshot.registry_id, self._snapshot.version + 1, services)
@@ -21,6 +21,64 @@ class ServiceUpdateHandler(BaseRequestHandler):
     def data_received(self, chunk):
         pass
 
+    @staticmethod
+    def create_service_entries(service):
+        """
+        Renders the given service as entries for the SmartClient services
+        tree: an entry for the service followed by an entry for each of its
+        request topics
+
+        :param service: The service (dict)
+        :return: The list of entries (dicts)
+        """
+        entries = [{"itemId": service.get("serviceGuid"),
+                    "itemName": service.get("serviceType"),
+                    "serviceType": service.get("serviceType"),
+                    "managed": str(service.get("managed")),
+                    "registrationTime": service.get("registrationTime"),
+                    "ttlMins": service.get("ttlMins"),
+                    "unauthorizedChannels": service.get("unauthorizedChannels"),
+                    "clientGuid": service.get("clientGuid"),
+                    "certificates": service.get("certificates"),
+                    "requestChannels": service.get("requestChannels"),
+                    "brokerGuid": service.get("brokerGuid"),
+                    "local": service.get("local"),
+                    "metaData": "<pre><code>" + json.dumps(
+                        service.get("metaData"), indent=4, sort_keys=True) +
+                                "</code></pre>"}]
+
+        for request_topic in service["requestChannels"]:
+            entries.append({"itemId": service["serviceGuid"] + request_topic,
+                            "itemName": request_topic,
+                            "parentId": service["serviceGuid"]})
+        return entries
+
+    @classmethod
+    def create_services_response(cls, module, snapshot):
+        """
+        Renders the service listing (each service and its request topics) for
+        the SmartClient services tree
+
+        :param module: The monitor module
+        :param snapshot: The :class:`ServicesSnapshot` to render
+        :return: The serialized response (JSON)
+        """
+        response_wrapper = module.create_smartclient_response_wrapper()
+
+        response = response_wrapper["response"]
+
+        for service_guid, service in snapshot.services.items():
+            logger.debug("Adding service, serviceGuid: %s", service_guid)
+            entries = cls.create_service_entries(service)
+            response["data"].extend(entries)
+            response['totalRows'] += len(entries)
+
+        response["endRow"] = max(0, response['totalRows'] - 1)
+        # Lets the client apply the service deltas pushed over the web socket
+        # from this version on
+        response["version"] = snapshot.version
+        return json.dumps(response_wrapper)
+
     @tornado.web.authenticated
     def get(self, *args, **kwargs):
 
@@ -29,40 +87,20 @@ class ServiceUpdateHandler(BaseRequestHandler):
             self.write(self._module.NO_RESULT_JSON)
             return
 
-        response_wrapper = self._module.create_smartclient_response_wrapper()
-
-        response = response_wrapper["response"]
-
-        for service_guid in self._module.services:
-            service = self._module.services[service_guid]
-            logger.debug("Adding service, serviceGuid: %s", service_guid)
-            entry = {"itemId": service.get("serviceGuid"),
-                     "itemName": service.get("serviceType"),
-                     "serviceType": service.get("serviceType"),
-                     "managed": str(service.get("managed")),
-                     "registrationTime": service.get("registrationTime"),
-                     "ttlMins": service.get("ttlMins"),
-                     "unauthorizedChannels": service.get("unauthorizedChannels"),
-                     "clientGuid": service.get("clientGuid"),
-                     "certificates": service.get("certificates"),
-                     "requestChannels": service.get("requestChannels"),
-                     "brokerGuid": service.get("brokerGuid"),
-                     "local": service.get("local"),
-                     "metaData": "<pre><code>" + json.dumps(
-                         service.get("metaData"), indent=4, sort_keys=True) +
-                                 "</code></pre>"}
-            response["data"].append(entry)
-
-            response['totalRows'] += 1
-
-            for request_topic in service["requestChannels"]:
-                entry = {"itemId": service["serviceGuid"] + request_topic,
-                         "itemName": request_topic,
-                         "parentId": service["serviceGuid"]}
-                response["data"].append(entry)
-
-                response['totalRows'] += 1
+        # The response only changes when the version of the services snapshot
+        # does, let the browser revalidate its copy by version
+        snapshot = self._module.service_monitor.snapshot
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("Etag", '"{0}-{1}"'.format(
+            snapshot.registry_id, snapshot.version))
+        if self.check_etag_header():
+            self.set_status(304)
+            return
 
-        response["endRow"] = max(0, response['totalRows'] - 1)
-        logger.debug("Service update handler response: %s", json.dumps(response_wrapper))
-        self.write(json.dumps(response_wrapper))
+        response_cache = self._module.service_monitor.response_cache
+        response = response_cache.get(snapshot.version)
+        if response is None:
+            response = self.create_services_response(self._module, snapshot)
+            response_cache.put(snapshot.version, response)
+            logger.debug("Service update handler response: %s", response)
+        self.write(response)
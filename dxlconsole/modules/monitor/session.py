@@ -0,0 +1,228 @@
+from __future__ import absolute_import
+import threading
+
+from ..._compat import monotonic
+from .message_queue import MessageQueue
+from .message_store import MessageStore
+
+
+class MonitorSession(object):
+    """
+    The state of a single console "session" (browser tab): its session-bound
+    DXL client, the queue of messages pending delivery, the store of captured
+    messages, its web socket and the time of its last keep-alive.
+
+    The pending messages queue and web socket are guarded by a lock owned by
+    the session, so that sessions do not contend with one another. The
+    message store is only accessed from the IOLoop thread.
+    """
+
+    def __init__(self, session_id, client, message_queue_size, message_store_size):
+        """
+        Constructor parameters:
+
+        :param session_id: The session identifier
+        :param client: The session-bound DXL client (:class:`SessionClient`)
+        :param message_queue_size: The maximum number of pending messages
+        :param message_store_size: The maximum number of captured messages
+        """
+        self._session_id = session_id
+        self._client = client
+        self._message_queue_size = message_queue_size
+        self._pending_messages = MessageQueue(message_queue_size)
+        self._message_store = MessageStore(message_store_size)
+        self._web_socket = None
+        self._lock = threading.Lock()
+        self._last_keep_alive = monotonic()
+        #: The (monotonic) time of the session's scheduled expiry check,
+        #: guarded by the module's session expiry lock
+        self.expiry_deadline = None
+
+    @property
+    def session_id(self):
+        """
+        Returns the session identifier
+
+        :return: The session identifier
+        """
+        return self._session_id
+
+    @property
+    def client(self):
+        """
+        Returns the session-bound DXL client
+
+        :return: The :class:`SessionClient` for the session
+        """
+        return self._client
+
+    @property
+    def message_store(self):
+        """
+        Returns the store of captured messages (only accessed from the IOLoop
+        thread)
+
+        :return: The :class:`MessageStore` for the session
+        """
+        return self._message_store
+
+    @property
+    def web_socket(self):
+        """
+        Returns the web socket for the session
+
+        :return: The web socket for the session or ``None``
+        """
+        return self._web_socket
+
+    @property
+    def last_keep_alive(self):
+        """
+        Returns the time of the last keep-alive received for the session
+
+        :return: The (monotonic) time of the last keep-alive
+        """
+        return self._last_keep_alive
+
+    def keep_alive(self):
+        """
+        Records the receipt of a keep-alive for the session
+        """
+        self._last_keep_alive = monotonic()
+
+    def queue_message(self, message):
+        """
+        Adds the given message to the pending messages queue. If the queue is
+        full, the oldest pending message is dropped.
+
+        :param message: The message to enqueue
+        """
+        with self._lock:
+            self._pending_messages.append(message)
+
+    def drain_messages(self):
+        """
+        Atomically retrieves and clears the pending messages. A fresh queue is
+        swapped in under the lock so that messages arriving while the
+        returned queue is being processed are retained for the next drain.
+
+        :return: The :class:`MessageQueue` of pending messages
+        """
+        with self._lock:
+            messages = self._pending_messages
+            self._pending_messages = MessageQueue(self._message_queue_size)
+        return messages
+
+    def set_web_socket(self, web_socket):
+        """
+        Sets the web socket for the session
+
+        :param web_socket: The web socket
+        """
+        with self._lock:
+            self._web_socket = web_socket
+
+    def remove_web_socket(self, web_socket):
+        """
+        Removes the given web socket from the session, unless it has since
+        been replaced by another one
+
+        :param web_socket: The web socket
+        """
+        with self._lock:
+            if self._web_socket is web_socket:
+                self._web_socket = None
+
+    def close(self):
+        """
+        Discards the pending messages and detaches the web socket of the
+        session
+
+        :return: The web socket that was detached or ``None``
+        """
+        with self._lock:
+            web_socket = self._web_socket
+            self._web_socket = None
+            self._pending_messages = MessageQueue(self._message_queue_size)
+        return web_socket
+
+
+class SessionIndex(object):
+    """
+    A thread-safe map of session identifiers to :class:`MonitorSession`
+    objects. The map is striped over a number of shards, each guarded by its
+    own lock, so that lookups for different sessions rarely contend.
+    """
+
+    def __init__(self, shard_count):
+        """
+        Constructor parameters:
+
+        :param shard_count: The number of shards
+        """
+        if shard_count < 1:
+            raise ValueError("Session index shard count must be at least 1")
+        self._shards = [(threading.Lock(), {}) for _ in range(shard_count)]
+
+    def _shard(self, session_id):
+        """
+        Returns the shard (lock and dictionary) for the given identifier
+
+        :param session_id: The session identifier
+        :return: The (lock, dictionary) tuple for the shard
+        """
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def get(self, session_id):
+        """
+        Returns the session for the given identifier
+
+        :param session_id: The session identifier
+        :return: The :class:`MonitorSession` or ``None``
+        """
+        lock, sessions = self._shard(session_id)
+        with lock:
+            return sessions.get(session_id)
+
+    def setdefault(self, session_id, session):
+        """
+        Stores the given session unless a session is already stored for its
+        identifier
+
+        :param session_id: The session identifier
+        :param session: The :class:`MonitorSession` to store
+        :return: The stored :class:`MonitorSession` (existing or given)
+        """
+        lock, sessions = self._shard(session_id)
+        with lock:
+            return sessions.setdefault(session_id, session)
+
+    def pop(self, session_id):
+        """
+        Removes the session for the given identifier
+
+        :param session_id: The session identifier
+        :return: The removed :class:`MonitorSession` or ``None``
+        """
+        lock, sessions = self._shard(session_id)
+        with lock:
+            return sessions.pop(session_id, None)
+
+    def values(self):
+        """
+        Returns all of the sessions
+
+        :return: A list of the :class:`MonitorSession` objects
+        """
+        result = []
+        for lock, sessions in self._shards:
+            with lock:
+                result.extend(sessions.values())
+        return result
+
+    def __len__(self):
+        count = 0
+        for lock, sessions in self._shards:
+            with lock:
+                count += len(sessions)
+        return count
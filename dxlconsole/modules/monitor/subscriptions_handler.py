@@ -3,6 +3,7 @@ import json
 
 import logging
 import tornado
+from tornado import gen
 
 from dxlconsole.handlers import BaseRequestHandler
 
@@ -12,8 +13,14 @@ logger = logging.getLogger(__name__)
 class SubscriptionsHandler(BaseRequestHandler):
     """
     Handles requests for the subscriptions list including fetch, add, and remove.
+
+    Connecting to the fabric and (un)subscribing block until the broker
+    responds, so they are run on the console's executor rather than the IOLoop.
     """
 
+    #: The time (in seconds) to wait for a subscription change to complete
+    SUBSCRIPTION_TIMEOUT = 30
+
     def __init__(self, application, request, module):
         super(SubscriptionsHandler, self).__init__(application, request)
         self._module = module
@@ -22,6 +29,7 @@ class SubscriptionsHandler(BaseRequestHandler):
         pass
 
     @tornado.web.authenticated
+    @gen.coroutine
     def get(self, *args, **kwargs):
         client_id = self.get_query_argument("clientId")
 
@@ -36,24 +44,45 @@ class SubscriptionsHandler(BaseRequestHandler):
 
         response = response_wrapper["response"]
 
-        if self.get_query_argument("_operationType") == "add":
-            # add operations require an empty response?
+        operation_type = self.get_query_argument("_operationType")
+        if operation_type in ("add", "remove"):
+            # add/remove operations require an empty response?
             topic = str(self.get_query_argument("topic"))
-            client.subscribe(topic)
-        elif self.get_query_argument("_operationType") == "remove":
-            # remove operations require an empty response?
-            topic = str(self.get_query_argument("topic"))
-            client.unsubscribe(topic)
+            try:
+                yield self.run_blocking(self.SUBSCRIPTION_TIMEOUT,
+                                        self._update_subscription,
+                                        client, operation_type, topic)
+            except gen.TimeoutError:
+                logger.error("Timed out changing subscription to topic: %s",
+                             topic)
+                self.write(self._module.create_smartclient_error_response(
+                    "Timed out waiting for the subscription to topic '" +
+                    topic + "' to change."))
+                return
         else:
             for subscription in client.subscriptions:
-                # don't include the client response topic
-                if "/mcafee/client" not in subscription:
-                    subscription_entry = {'topic': subscription}
-                    response["data"].append(subscription_entry)
+                subscription_entry = {'topic': subscription}
+                response["data"].append(subscription_entry)
 
-            response["endRow"] = len(client.subscriptions) - 1
-            response["totalRows"] = len(client.subscriptions) - 1
+            response["endRow"] = max(0, len(response["data"]) - 1)
+            response["totalRows"] = len(response["data"])
 
         logger.debug(
             "Subscription handler response: %s", json.dumps(response_wrapper))
         self.write(response_wrapper)
+
+    def _update_subscription(self, client, operation_type, topic):
+        """
+        Subscribes (or unsubscribes) the session-bound client to the specified
+        topic, connecting to the fabric first if necessary. This method blocks
+        and is run on the console's executor.
+
+        :param client: The session-bound DXL client
+        :param operation_type: The operation, ``add`` or ``remove``
+        :param topic: The topic
+        """
+        self._module.connect_dxl_client()
+        if operation_type == "add":
+            client.subscribe(topic)
+        else:
+            client.unsubscribe(topic)
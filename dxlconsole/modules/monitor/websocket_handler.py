@@ -1,73 +1,97 @@
 from __future__ import absolute_import
 import logging
-import tornado
-from tornado.websocket import WebSocketHandler
-from dxlclient import EventCallback, ResponseCallback
-
-logger = logging.getLogger(__name__)
-
-
-class _WebSocketEventCallback(EventCallback):
-    """
-    A DXL event callback to handle all events by adding them to delivery queues
-    and notifying the browser through WebSockets.
-    """
+import threading
 
-    def __init__(self, web_socket, module):
-        super(_WebSocketEventCallback, self).__init__()
-        self._socket = web_socket
-        self._module = module
+import tornado
+from tornado.escape import json_encode
+from tornado.websocket import WebSocketHandler, WebSocketClosedError
 
-    def on_event(self, event):
-        """
-        Adds the event to a pending messages queue and notifies the associated
-        WebSocket that an event is waiting
+from .client_multiplexer import SessionMessageCallback
+from .messages_handler import MessagesHandler
 
-        :param event: the incoming event
-        """
-        logger.debug("Received event on topic: %s", event.destination_topic)
-        self._module.queue_message(event, self._socket._client_id)
-        self._module.io_loop.add_callback(self._socket.write_message,
-                                          u"messagesPending")
+logger = logging.getLogger(__name__)
 
 
-class _WebSocketResponseCallback(ResponseCallback):
+class _WebSocketMessageCallback(SessionMessageCallback):
     """
-    A DXL Response callback to handle all responses by adding them to delivery
-    queues and notifying the browser through WebSockets.
+    A session message callback to handle all events and responses by adding
+    them to delivery queues and notifying the browser through WebSockets.
     """
 
     def __init__(self, web_socket, module):
-        super(_WebSocketResponseCallback, self).__init__()
+        super(_WebSocketMessageCallback, self).__init__()
         self._socket = web_socket
         self._module = module
 
-    def on_response(self, response):
+    def on_message(self, message):
         """
-        Adds the response to a pending messages queue and notifies the
-        associated WebSocket that a response is waiting
+        Adds the message to a pending messages queue and notifies the
+        associated WebSocket that a message is waiting
 
-        :param response: the incoming response
+        :param message: the :class:`MessageRecord` for the incoming event or
+            response
         """
-        logger.debug(
-            "Received response to message: %s", response.request_message_id)
-        self._module.queue_message(response, self._socket._client_id)
-        self._module.io_loop.add_callback(self._socket.write_message,
-                                          u"messagesPending")
+        logger.debug("Received message on topic: %s", message.topic)
+        self._module.queue_message(message, self._socket._client_id)
+        self._socket.notify_messages_pending()
 
 
 class ConsoleWebSocketHandler(WebSocketHandler):
     """
-    Handles the WebSocket connection used to notify the client of updates in real time
+    Handles the WebSocket connection used to notify the client of updates in real time.
+
+    By default, the client is notified with a ``messagesPending`` frame and
+    fetches the pending messages via the ``/messages`` handler. If the client
+    opens the socket with ``stream=true``, pending messages are rendered and
+    pushed directly over the socket as JSON frames instead. A streaming client
+    that is not keeping up (too much data waiting to be written to it) falls
+    back to the ``messagesPending`` notification until it catches up.
+    Likewise, changes to the service registry are pushed to a streaming
+    client as ``serviceDeltas`` frames, other clients are sent a
+    ``serviceUpdates`` notification to fetch the full service listing.
+
+    Notifications are coalesced: while a notification is waiting to be
+    handled on the IOLoop, additional messages queued for the client do not
+    schedule another one. The module's message notification delay can be
+    used to widen the coalescing window beyond a single IOLoop iteration.
     """
 
+    # The maximum number of bytes of streamed message frames that may be
+    # waiting to be written to the client before falling back to polling
+    _MAX_STREAM_WRITE_BUFFER_SIZE = 1024 * 1024
+
     def __init__(self, application, request, module):
         super(ConsoleWebSocketHandler, self).__init__(application, request)
-        self._event_callback = None
-        self._response_callback = None
+        self._message_callback = None
         self._client = None
         self._client_id = None
         self._module = module
+        self._stream_messages = False
+        self._stream_write_buffer_size = 0
+        self._notification_lock = threading.Lock()
+        self._notification_pending = False
+        self._notification_count = 0
+        self._coalesced_notification_count = 0
+
+    @property
+    def notification_count(self):
+        """
+        Returns the number of pending message notifications that have been
+        scheduled for the web socket
+
+        :return: The number of pending message notifications scheduled
+        """
+        return self._notification_count
+
+    @property
+    def coalesced_notification_count(self):
+        """
+        Returns the number of pending message notifications that were folded
+        into an already scheduled notification
+
+        :return: The number of coalesced pending message notifications
+        """
+        return self._coalesced_notification_count
 
     def get_current_user(self):
         return self.get_secure_cookie("user")
@@ -84,21 +108,115 @@ class ConsoleWebSocketHandler(WebSocketHandler):
 
         logger.debug("Creating web socket for client: %s", client_id)
         self._client_id = client_id
-        self._event_callback = _WebSocketEventCallback(self, self._module)
-        self._response_callback = _WebSocketResponseCallback(self, self._module)
+        self._stream_messages = \
+            self.get_query_argument("stream", "false").lower() == "true"
+        self._message_callback = _WebSocketMessageCallback(self, self._module)
         self._client = self._module.get_dxl_client(str(client_id))
         self._module.add_web_socket(client_id, self)
 
-        self._client.add_event_callback(None, self._event_callback)
-        self._client.add_response_callback(None, self._response_callback)
+        self._client.set_callback(self._message_callback)
+
+    def notify_messages_pending(self):
+        """
+        Schedules a pending messages notification for the web socket unless
+        one is already scheduled. This method is thread-safe and is invoked
+        from the DXL callback threads.
+        """
+        with self._notification_lock:
+            if self._notification_pending:
+                self._coalesced_notification_count += 1
+                return
+            self._notification_pending = True
+            self._notification_count += 1
+
+        io_loop = self._module.io_loop
+        delay = self._module.message_notification_delay
+        if delay:
+            io_loop.add_callback(io_loop.call_later, delay,
+                                 self._on_messages_pending)
+        else:
+            io_loop.add_callback(self._on_messages_pending)
+
+    def _on_messages_pending(self):
+        """
+        Invoked on the IOLoop thread when messages have been queued for the
+        client associated with the web socket
+        """
+        # Clear the flag prior to draining so that messages queued from this
+        # point on schedule a new notification
+        with self._notification_lock:
+            self._notification_pending = False
+
+        try:
+            if self._stream_messages and \
+                    self._stream_write_buffer_size < self._MAX_STREAM_WRITE_BUFFER_SIZE:
+                self._write_pending_messages()
+            else:
+                self.write_message(u"messagesPending")
+        except WebSocketClosedError:
+            logger.debug("Web socket already closed for client: %s",
+                         self._client_id)
+
+    def _write_pending_messages(self):
+        """
+        Moves the messages pending for the client into its message store and
+        writes them to the web socket as a single JSON frame
+        """
+        entries, dropped_count = MessagesHandler.store_pending_messages(
+            self._module, self._client_id)
+        if not entries:
+            return
+
+        frame = json_encode({
+            "type": "messages",
+            "droppedMessages": dropped_count,
+            "data": entries
+        })
+        frame_size = len(frame)
+        self._stream_write_buffer_size += frame_size
+
+        def on_frame_written(_):
+            self._stream_write_buffer_size -= frame_size
+
+        self.write_message(frame).add_done_callback(on_frame_written)
+
+    def notify_service_deltas(self, frame):
+        """
+        Invoked on the IOLoop thread to push changes to the service registry
+        to the client. A client that is not streaming (or is not keeping up
+        with the streamed frames) is instead notified to fetch the full
+        service listing.
+
+        :param frame: The ``serviceDeltas`` JSON frame
+        """
+        try:
+            if self._stream_messages and \
+                    self._stream_write_buffer_size < self._MAX_STREAM_WRITE_BUFFER_SIZE:
+                self.write_message(frame)
+            else:
+                self.write_message(u"serviceUpdates")
+        except WebSocketClosedError:
+            logger.debug("Web socket already closed for client: %s",
+                         self._client_id)
 
     def on_message(self, message):
+        # The client sends a keep-alive every minute, report the notification
+        # counts along with it so that the coalescing can be observed while
+        # the socket is open
+        logger.debug("Keep-alive from web socket for client: %s "
+                     "(notifications: %d, coalesced notifications: %d)",
+                     self._client_id, self._notification_count,
+                     self._coalesced_notification_count)
         self._module.client_keep_alive(self._client_id)
 
     def on_close(self):
-        logger.debug("Web socket closed for client: %s", self._client_id)
+        logger.debug("Web socket closed for client: %s (notifications: %d, "
+                     "coalesced notifications: %d)", self._client_id,
+                     self._notification_count,
+                     self._coalesced_notification_count)
         if self._client:
-            self._client.remove_event_callback(None, self._event_callback)
-            self._client.remove_response_callback(None, self._response_callback)
+            # Only the callback of this web socket is removed, a newer web
+            # socket for the client may have replaced it
+            self._client.clear_callback(self._message_callback)
 
-        self._module.remove_web_socket(self._client_id)
+        self._module.remove_web_socket(self._client_id, self)
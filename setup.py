@@ -4,9 +4,11 @@ from __future__ import absolute_import
 import glob
 import os
 import distutils.command.sdist
+import distutils.errors
 import distutils.log
 import subprocess
 from setuptools import Command, setup
+import setuptools.command.build_py
 import setuptools.command.sdist
 
 # Patch setuptools' sdist behaviour with distutils' sdist behaviour
@@ -17,6 +19,12 @@ CWD = os.path.abspath(os.path.dirname(__file__))
 with open(os.path.join(CWD, "dxlconsole", "_version.py")) as f:
     exec(f.read(), VERSION_INFO)  # pylint: disable=exec-used
 
+# The assets module is loaded directly, as importing the package requires its
+# dependencies
+ASSETS = {}
+with open(os.path.join(CWD, "dxlconsole", "assets.py")) as f:
+    exec(f.read(), ASSETS)  # pylint: disable=exec-used
+
 
 class LintCommand(Command):
     """
@@ -37,6 +45,58 @@ class LintCommand(Command):
                               glob.glob("dxlconsole/*.py"))
 
 
+class PackAssetsCommand(Command):
+    """
+    Custom setuptools command for writing the console's web assets (and their
+    gzip-compressed copies, served in place of the assets to clients that
+    accept gzip) to the single archive that the console serves them from.
+    The archive is only rewritten if it is older than the web assets.
+    """
+    description = 'write the web assets to a single archive'
+    user_options = []
+    def initialize_options(self):
+        pass
+    def finalize_options(self):
+        pass
+    def run(self):
+        web_dir = os.path.join(CWD, "dxlconsole", ASSETS["DIRECTORY_NAME"])
+        archive_path = os.path.join(CWD, "dxlconsole", ASSETS["ARCHIVE_NAME"])
+        if not os.path.isdir(web_dir):
+            if not os.path.isfile(archive_path):
+                raise distutils.errors.DistutilsError(
+                    "Neither the web assets directory nor the archive exists")
+            # Building from a source distribution, which contains the archive
+            self.announce("No web assets directory, keeping the archive",
+                          level=distutils.log.INFO)
+            return
+        if ASSETS["is_archive_current"](web_dir, archive_path):
+            self.announce("The web assets archive is up to date",
+                          level=distutils.log.INFO)
+            return
+        count = ASSETS["write_asset_archive"](web_dir, archive_path)
+        self.announce("Wrote {0} web assets to the archive".format(count),
+                      level=distutils.log.INFO)
+
+
+class BuildPyCommand(setuptools.command.build_py.build_py):
+    """
+    Builds the package, writing the web assets archive first
+    """
+    def run(self):
+        self.run_command("pack_assets")
+        setuptools.command.build_py.build_py.run(self)
+
+
+class SdistCommand(setuptools.command.sdist.sdist):
+    """
+    Builds the source distribution, which contains the web assets archive
+    (see MANIFEST.in) rather than the web assets, writing the archive first
+    """
+    def run(self):
+        self.run_command("pack_assets")
+        setuptools.command.sdist.sdist.run(self)
+
+
 class CiCommand(Command):
     """
     Custom setuptools command for running steps that are performed during
@@ -67,7 +127,7 @@ setup(
         "tornado",
         "dxlbootstrap>=0.1.3",
         "dxlclient",
-        "beautifulSoup4"
+        "futures; python_version == '2.7'"
     ],
 
     tests_require=TEST_REQUIREMENTS,
@@ -95,69 +155,7 @@ setup(
         "dxlconsole.modules",
         "dxlconsole.modules.broker",
         "dxlconsole.modules.certificates",
-        "dxlconsole.modules.monitor",
-        "dxlconsole.web",
-        "dxlconsole.web.jquery",
-        "dxlconsole.web.images",
-        "dxlconsole.web.isomorphic",
-        "dxlconsole.web.isomorphic.locales",
-        "dxlconsole.web.isomorphic.login",
-        "dxlconsole.web.isomorphic.system",
-        "dxlconsole.web.isomorphic.system.development",
-        "dxlconsole.web.isomorphic.system.helpers",
-        "dxlconsole.web.isomorphic.system.language",
-        "dxlconsole.web.isomorphic.system.modules",
-        "dxlconsole.web.isomorphic.system.modules-debug",
-        "dxlconsole.web.isomorphic.system.schema",
-        "dxlconsole.web.isomorphic.skins",
-        "dxlconsole.web.isomorphic.skins.Tahoe",
-        "dxlconsole.web.isomorphic.skins.Tahoe.fonts",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.actions",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.button",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Calendar",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.ColorPicker",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.controls",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.cssButton",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.CubeGrid",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.DatabaseBrowser",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.DateChooser",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Dialog",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.DynamicForm",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.edges",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.FileBrowser",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.headerIcons",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.ImgButton",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.iOS",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.ListGrid",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Menu",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.MultiUploadItem",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.NavigationBar",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Panel",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.pickers",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Progressbar",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.RecordEditor",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.RichTextEditor",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.SchemaViewer",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Scrollbar",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.SectionHeader",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.shared",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Slider",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Splitbar",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Tab",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.TabSet",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.TileGrid",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.ToolStrip",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.TransferIcons",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.TreeGrid",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Window",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.shared.shadows",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Tab.bottom",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Tab.left",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Tab.right",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Tab.top",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.ToolStrip.button",
-        "dxlconsole.web.isomorphic.skins.Tahoe.images.Window.icons"
+        "dxlconsole.modules.monitor"
     ],
 
     package_data={'': ['*.*'],
@@ -187,7 +185,10 @@ setup(
     ],
 
     cmdclass={
+        "build_py": BuildPyCommand,
         "ci": CiCommand,
-        "lint": LintCommand
+        "lint": LintCommand,
+        "pack_assets": PackAssetsCommand,
+        "sdist": SdistCommand
     }
 )